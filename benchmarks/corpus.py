@@ -0,0 +1,74 @@
+"""Generates synthetic SGF games for benchmarking, with configurable length, branching, comment size and encoding.
+
+Usage: python benchmarks/corpus.py OUTPUT_DIR [--games N] [--moves N] [--branching N] [--comment-length N]
+                                   [--encoding ENCODING]
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from katrain.core.sgf_parser import Move, SGFNode  # noqa: E402
+
+COMMENT_CHARACTERS = "abcdefghijklmnopqrstuvwxyz      .,()[]\\\n" + "éüøß" + "囲碁黒白石目" + "바둑"
+
+
+def comment_characters(encoding):
+    """Returns the characters used in comments which the encoding can represent, including any multi-byte ones."""
+    return [c for c in COMMENT_CHARACTERS if c.encode(encoding, errors="ignore")]
+
+
+def make_game(moves=250, branching=0, branch_every=10, variation_length=5, comment_length=0, encoding="utf-8", seed=0):
+    """Returns an SGF game as a string, with a main line of the given number of moves. Every branch_every moves,
+    branching side variations of variation_length moves start, and every node has a comment of comment_length
+    characters which are all representable in the encoding."""
+    rng = random.Random(seed)
+    characters = comment_characters(encoding)
+
+    def node(i):
+        coords = Move.SGF_COORD[rng.randrange(19)] + Move.SGF_COORD[rng.randrange(19)]
+        comment = "".join(rng.choice(characters) for _ in range(comment_length))
+        return f";{'BW'[i % 2]}[{coords}]" + (f"C[{SGFNode._escape_value(comment)}]" if comment else "")
+
+    parts, closing = [], []  # variations are closed after the rest of the main line
+    for i in range(moves):
+        if branching and i and i % branch_every == 0:
+            variations = [
+                "(" + "".join(node(j) for j in range(i, i + variation_length)) + ")" for _ in range(branching)
+            ]
+            parts.append("(")
+            closing.append(")" + "".join(variations))
+        parts.append(node(i))
+    main_line = "".join(parts) + "".join(reversed(closing))
+    return f"(;GM[1]FF[4]SZ[19]CA[{encoding}]PB[Black]PW[White]KM[6.5]{main_line})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output_dir", help="folder to write the games to")
+    parser.add_argument("--games", type=int, default=100, help="number of games")
+    parser.add_argument("--moves", type=int, default=250, help="moves in the main line of each game")
+    parser.add_argument("--branching", type=int, default=0, help="side variations at each branch point")
+    parser.add_argument("--branch-every", type=int, default=10, help="moves between branch points")
+    parser.add_argument("--comment-length", type=int, default=0, help="characters in the comment of each node")
+    parser.add_argument("--encoding", default="utf-8", help="file encoding, also stored in the CA property")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for i in range(args.games):
+        game = make_game(
+            args.moves,
+            args.branching,
+            args.branch_every,
+            comment_length=args.comment_length,
+            encoding=args.encoding,
+            seed=i,
+        )
+        with open(os.path.join(args.output_dir, f"game{i:05d}.sgf"), "wb") as f:
+            f.write(game.encode(args.encoding))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Measures Move coordinate parsing and formatting over a full game's worth of synthetic analysis results.
+
+Usage: python benchmarks/move_lookup.py [--moves N] [--candidates N] [--pv-length N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from katrain.core.sgf_parser import Move  # noqa: E402
+
+
+def make_analysis(num_moves, num_candidates, pv_length, board_size=19, seed=0):
+    """Builds analysis results shaped like the KataGo analysis JSON, one per move of the game."""
+    rng = random.Random(seed)
+
+    def gtp():
+        return Move.GTP_COORD[rng.randrange(board_size)] + str(rng.randrange(board_size) + 1)
+
+    return [
+        {
+            "moveInfos": [
+                {"move": gtp(), "order": i, "pv": [gtp() for _ in range(pv_length)]} for i in range(num_candidates)
+            ],
+            "rootInfo": {"currentPlayer": "BW"[n % 2]},
+        }
+        for n in range(num_moves)
+    ]
+
+
+def process(analyses, board_size=(19, 19)):
+    """Converts every candidate and PV move, as the candidate list, PV display and hints do."""
+    count = 0
+    for analysis in analyses:
+        player = analysis["rootInfo"]["currentPlayer"]
+        for move_info in analysis["moveInfos"]:
+            move = Move.from_gtp(move_info["move"], player=player)
+            Move.from_sgf(move.sgf(board_size), board_size, player=player).gtp()
+            count += 2
+            for gtp in move_info["pv"]:
+                Move.from_gtp(gtp, player=player).gtp()
+                count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--moves", type=int, default=300, help="number of analyzed positions")
+    parser.add_argument("--candidates", type=int, default=30, help="candidate moves per position")
+    parser.add_argument("--pv-length", type=int, default=15, help="moves per principal variation")
+    args = parser.parse_args()
+
+    analyses = make_analysis(args.moves, args.candidates, args.pv_length)
+    for run in ["first", "repeat"]:
+        start = time.perf_counter()
+        count = process(analyses)
+        elapsed = time.perf_counter() - start
+        print(f"{run:>6}: {count} conversions in {elapsed:.3f}s, {elapsed / count * 1e9:.0f} ns per conversion")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Measures memory used per node for a tree of SGFNode, and of GameNode when its dependencies are installed.
+
+Usage: python benchmarks/node_memory.py [--nodes N]
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("KIVY_NO_ARGS", "1")  # the arguments are for this script, not for kivy
+
+from katrain.core.sgf_parser import SGF, Move  # noqa: E402
+
+
+def make_tree_sgf(num_nodes, branch_every=10, branch_length=5):
+    """Builds a game with a mainline, and a short side variation every branch_every moves."""
+
+    def node(i):
+        return f";{'BW'[i % 2]}[{Move.SGF_COORD[i % 19]}{Move.SGF_COORD[(i // 19) % 19]}]"
+
+    parts, count, i = ["(;GM[1]FF[4]SZ[19]"], 1, 0
+    while count < num_nodes:
+        if i % branch_every == branch_every - 1 and count + branch_length < num_nodes:
+            parts.append("(" + "".join(node(i + j) for j in range(branch_length)) + ")(")
+            count += branch_length
+        parts.append(node(i))
+        count += 1
+        i += 1
+    return "".join(parts) + ")" * (1 + "".join(parts).count(")("))
+
+
+def bytes_per_node(sgf_class, contents):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    root = sgf_class.parse(contents)
+    num_nodes = len(root.nodes_in_tree)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return num_nodes, used / num_nodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=10_000, help="number of nodes in the tree")
+    args = parser.parse_args()
+
+    contents = make_tree_sgf(args.nodes)
+    classes = [("SGFNode", SGF)]
+    try:
+        from katrain.core.game import KaTrainSGF
+
+        classes.append(("GameNode", KaTrainSGF))
+    except ImportError as e:
+        print(f"Skipping GameNode: {e}")
+    for name, sgf_class in classes:
+        num_nodes, per_node = bytes_per_node(sgf_class, contents)
+        print(f"{name:>10}: {num_nodes} nodes, {per_node:.0f} bytes per node")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Measures SGF.parse time against input size, to check that parsing scales linearly.
+
+Usage: python benchmarks/parse_scaling.py [--max-size BYTES]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from katrain.core.sgf_parser import SGF, Move  # noqa: E402
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000, 50_000_000]
+
+
+def make_sgf(target_size, comment_length=200):
+    """Builds a single-branch game with commented moves, of roughly target_size bytes."""
+    parts = ["(;GM[1]FF[4]SZ[19]CA[UTF-8]"]
+    size, i = len(parts[0]), 0
+    comment = ("Lorem ipsum [dolor\\] sit amet " * (comment_length // 30 + 1))[:comment_length]
+    while size < target_size:
+        coords = Move.SGF_COORD[i % 19] + Move.SGF_COORD[(i // 19) % 19]
+        node = f";{'BW'[i % 2]}[{coords}]C[{comment}]"
+        parts.append(node)
+        size += len(node)
+        i += 1
+    parts.append(")")
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-size", type=int, default=SIZES[-1], help="largest input size in bytes")
+    args = parser.parse_args()
+
+    print(f"{'bytes':>12} {'nodes':>8} {'seconds':>9} {'MB/s':>7} {'ns/byte':>12}")
+    for size in [s for s in SIZES if s <= args.max_size]:
+        contents = make_sgf(size)
+        start = time.perf_counter()
+        root = SGF.parse(contents)
+        elapsed = time.perf_counter() - start
+        depth = 0
+        while root.children:
+            root = root.children[0]
+            depth += 1
+        print(
+            f"{len(contents):>12} {depth:>8} {elapsed:>9.3f} {len(contents) / elapsed / 1e6:>7.2f} "
+            f"{elapsed / len(contents) * 1e9:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Runs the parser and serializer benchmarks on synthetic games, writing the results as JSON for comparing commits.
+
+Usage: python benchmarks/suite.py [--quick] [--repeat N] [--output FILE] [--compare BASELINE_FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("KIVY_NO_ARGS", "1")  # the arguments are for this script, not for kivy
+
+from corpus import make_game  # noqa: E402
+from katrain.core.sgf_parser import SGF  # noqa: E402
+
+CASES = {  # name -> make_game arguments
+    "plain": {"moves": 300},
+    "commented": {"moves": 300, "comment_length": 200},
+    "branched": {"moves": 300, "branching": 3, "comment_length": 50},
+    "shift_jis": {"moves": 300, "comment_length": 200, "encoding": "shift_jis"},
+    "long": {"moves": 20_000, "branching": 1, "comment_length": 50},
+}
+QUICK_CASES = ["plain", "branched", "shift_jis"]
+
+
+def best_time(function, repeat, setup=None):
+    """Returns the fastest of several runs, which is the least affected by other load on the machine."""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def analyzed_tree(contents):
+    """Parses a game as a KaTrain tree and gives every node synthetic analysis, so that comments are generated."""
+    from katrain.core.game import KaTrainSGF
+
+    root = KaTrainSGF.parse(contents)
+    for i, node in enumerate(root.iter_preorder()):
+        move_infos = [
+            {"move": gtp, "visits": 100, "scoreLead": i * 0.1 + j, "winrate": 0.5, "order": j, "pv": [gtp] * 8}
+            for j, gtp in enumerate(["D4", "Q16", "Q4", "D16", "K10"])
+        ]
+        root_info = {"scoreLead": i * 0.1, "winrate": 0.5, "visits": 500}
+        node.set_analysis({"moveInfos": move_infos, "rootInfo": root_info, "policy": [1 / 362] * 362}, None)
+    return root
+
+
+def run_case(name, game_arguments, repeat):
+    encoding = game_arguments.get("encoding", "utf-8")
+    contents = make_game(**game_arguments)
+    encoded = contents.encode(encoding)
+    root = SGF.parse(contents)
+    nodes = list(root.iter_preorder())
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "game.sgf")
+        with open(path, "wb") as f:
+            f.write(encoded)
+        results["SGF.parse"] = best_time(lambda: SGF.parse(contents), repeat)
+        results["SGF.parse_file"] = best_time(lambda: SGF.parse_file(path), repeat)
+        results["SGF.parse_file(lazy)"] = best_time(lambda: SGF.parse_file(path, lazy_variations=True), repeat)
+    results["SGFNode.sgf"] = best_time(root.sgf, repeat, setup=lambda: [node._invalidate_sgf() for node in nodes])
+    results["SGFNode.sgf(cached)"] = best_time(root.sgf, repeat)
+    try:
+        game_root = analyzed_tree(contents)
+    except ImportError as e:  # the GameNode benchmarks need the gui dependencies
+        print(f"Skipping GameNode for {name}: {e}", file=sys.stderr)
+    else:
+        game_nodes = list(game_root.iter_preorder())
+        xargs = {"save_comments_player": {"B": True, "W": True}, "save_comments_class": [True] * 6}
+        xargs["eval_thresholds"] = [12, 6, 3, 1.5, 0.5, 0]
+        results["GameNode.sgf_properties"] = best_time(
+            lambda: [node.sgf_properties(**xargs) for node in game_nodes], repeat
+        )
+    return [
+        {
+            "case": name,
+            "benchmark": benchmark,
+            "arguments": game_arguments,
+            "bytes": len(encoded),
+            "nodes": len(nodes),
+            "seconds": seconds,
+            "mb_per_s": len(encoded) / seconds / 1e6 if seconds > 0 else None,
+            "us_per_node": seconds / len(nodes) * 1e6,
+        }
+        for benchmark, seconds in results.items()
+    ]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,  # capture_output and text need python 3.7
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help=f"only run the cases {', '.join(QUICK_CASES)}")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark, of which the fastest is kept")
+    parser.add_argument("--output", "-o", default=None, help="file to write the JSON results to")
+    parser.add_argument("--compare", default=None, help="earlier JSON results to show the speedup against")
+    args = parser.parse_args()
+
+    cases = {name: CASES[name] for name in QUICK_CASES} if args.quick else CASES
+    results = []
+    for name, game_arguments in cases.items():
+        results += run_case(name, game_arguments, args.repeat)
+    report = {"commit": git_commit(), "python": platform.python_version(), "repeat": args.repeat, "results": results}
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r["case"], r["benchmark"]): r["seconds"] for r in json.load(f)["results"]}
+    print(f"{'case':>10} {'benchmark':>24} {'nodes':>7} {'seconds':>9} {'us/node':>8} {'speedup':>8}", file=sys.stderr)
+    for r in results:
+        before = baseline.get((r["case"], r["benchmark"]))
+        speedup = f"{before / r['seconds']:>7.2f}x" if before and r["seconds"] > 0 else ""
+        print(
+            f"{r['case']:>10} {r['benchmark']:>24} {r['nodes']:>7} {r['seconds']:>9.4f} {r['us_per_node']:>8.2f} "
+            f"{speedup:>8}",
+            file=sys.stderr,
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -63,6 +63,7 @@ from katrain.gui.popups import ConfigTeacherPopup, ConfigTimerPopup, I18NPopup
 from katrain.core.base_katrain import KaTrainBase
 from katrain.core.engine import KataGoEngine
 from katrain.core.game import Game, IllegalMoveException, KaTrainSGF
+from katrain.core.analysis_bundle import EXTENSION as ANALYSIS_BUNDLE_EXTENSION, read_analysis_bundle
 from katrain.core.sgf_parser import Move, ParseError
 from katrain.gui.kivyutils import *
 from katrain.gui.popups import ConfigPopup, LoadSGFPopup, NewGamePopup, AIPopup
@@ -334,7 +335,10 @@ class KaTrainGui(Screen, KaTrainBase):
                     self._config["general"]["sgf_load"] = path
                     self.save_config("general")
                 try:
-                    move_tree = KaTrainSGF.parse_file(files[0])
+                    if files[0].lower().endswith(ANALYSIS_BUNDLE_EXTENSION):
+                        move_tree = read_analysis_bundle(files[0], node_class=KaTrainSGF._NODE_CLASS)
+                    else:
+                        move_tree = KaTrainSGF.parse_file(files[0], lazy_variations=True)
                 except ParseError as e:
                     self.log(i18n._("Failed to load SGF").format(error=e), OUTPUT_ERROR)
                     return
@@ -363,9 +367,8 @@ class KaTrainGui(Screen, KaTrainBase):
                 i18n._("Failed to import from clipboard").format(error=exc, contents=clipboard[:50])
             )
             return
-        move_tree.nodes_in_tree[-1].analyze(
-            self.engine, analyze_fast=False
-        )  # speed up result for looking at end of game
+        *_, end_of_game = move_tree.iter_mainline()
+        end_of_game.analyze(self.engine, analyze_fast=False)  # speed up result for looking at end of game
         self._do_new_game(move_tree=move_tree, analyze_fast=True)
         self("redo", 999)
         self.log("Imported game from clipboard.", OUTPUT_INFO)
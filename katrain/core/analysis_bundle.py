@@ -0,0 +1,109 @@
+"""Binary save format for a game tree together with its analysis, so that reviews reopen
+without running the engine again.
+
+Layout: MAGIC, the format version and the length of the index as little-endian uint32, the index as UTF-8 JSON
+padded with spaces to a multiple of 4 bytes, then all ownership and policy values as little-endian float32.
+The index holds one entry per node in pre-order, with the position of its parent, its properties, analysis,
+note, and the offset and length of its ownership and policy values. Children are written in the order they were
+added rather than ordered_children, so reading recreates the tree exactly, which then orders its branches as before.
+"""
+import array
+import json
+import struct
+import sys
+from typing import BinaryIO, Dict, List
+
+from katrain.core.game_node import GameNode
+from katrain.core.sgf_parser import ParseError, open_contents
+
+MAGIC = b"KTAB"
+VERSION = 1
+EXTENSION = ".ktab"
+HEADER = struct.Struct("<4sII")
+ARRAY_ATTRIBUTES = ["ownership", "policy"]
+NODE_ATTRIBUTES = ["note", "auto_undo", "ai_thoughts"]
+
+
+def write_analysis_bundle(root: GameNode, file: BinaryIO):
+    """Writes the tree below root with all its analysis to a binary file object."""
+    positions = {}
+    values = array.array("f")
+    entries: List[Dict] = []
+    for node in root.iter_preorder():
+        positions[id(node)] = len(entries)
+        entry = {"parent": positions[id(node.parent)] if node is not root else -1, "properties": node.properties}
+        if node.analysis_ready or node.analysis["moves"]:
+            entry["analysis"] = {"root": node.analysis["root"], "moves": list(node.analysis["moves"].values())}
+        for attribute in ARRAY_ATTRIBUTES:
+            node_values = getattr(node, attribute)
+            if node_values:
+                entry[attribute] = [len(values), len(node_values)]
+                values.extend(node_values)
+        for attribute in NODE_ATTRIBUTES:
+            if getattr(node, attribute) not in (None, ""):  # auto_undo False still orders the children
+                entry[attribute] = getattr(node, attribute)
+        entries.append(entry)
+
+    index = json.dumps({"nodes": entries}, separators=(",", ":")).encode("utf-8")
+    index += b" " * (-len(index) % 4)  # keeps the values aligned for casting
+    if sys.byteorder == "big":
+        values.byteswap()
+    file.write(HEADER.pack(MAGIC, VERSION, len(index)))
+    file.write(index)
+    file.write(values.tobytes())
+
+
+def read_analysis_bundle(filename: str, node_class=GameNode) -> GameNode:
+    """Reads a tree written by write_analysis_bundle, returning its root. Ownership and policy values are copied
+    out of the file, so it can be overwritten or deleted while the tree is in use."""
+    with open_contents(filename) as contents:
+        return _read_analysis_bundle(contents, filename, node_class)
+
+
+def _read_analysis_bundle(contents, filename: str, node_class) -> GameNode:
+    if len(contents) < HEADER.size:
+        raise ParseError(f"Not an analysis bundle: {filename}")
+    magic, version, index_length = HEADER.unpack_from(contents)
+    if magic != MAGIC:
+        raise ParseError(f"Not an analysis bundle: {filename}")
+    if version > VERSION:
+        raise ParseError(f"Analysis bundle version {version} is newer than supported version {VERSION}")
+    start = HEADER.size + index_length
+    if index_length % 4 or start > len(contents) or (len(contents) - start) % 4:
+        raise ParseError(f"Analysis bundle {filename} is truncated or corrupt")
+    try:
+        index = json.loads(contents[HEADER.size : start].decode("utf-8"))
+    except ValueError as e:  # also for invalid UTF-8
+        raise ParseError(f"Analysis bundle {filename} has a corrupt index: {e}")
+    values = array.array("f")
+    values.frombytes(contents[start:])
+    if sys.byteorder == "big":
+        values.byteswap()
+
+    nodes = []
+    try:
+        for entry in index["nodes"]:
+            if not -1 <= entry["parent"] < len(nodes) or (entry["parent"] == -1) != (not nodes):
+                raise ParseError(f"Analysis bundle {filename} has a node with an invalid parent")
+            node = node_class(parent=nodes[entry["parent"]] if entry["parent"] >= 0 else None)
+            for property, property_values in entry["properties"].items():
+                node.set_property(property, property_values)
+            if "analysis" in entry:
+                analysis = node._updatable_analysis()
+                analysis["root"] = entry["analysis"]["root"]
+                analysis["moves"] = {move["move"]: move for move in entry["analysis"]["moves"]}
+            for attribute in ARRAY_ATTRIBUTES:
+                if attribute in entry:
+                    offset, length = entry[attribute]
+                    if not 0 <= offset <= offset + length <= len(values):
+                        raise ParseError(f"Analysis bundle {filename} has {attribute} values beyond its end")
+                    setattr(node, attribute, values[offset : offset + length])
+            for attribute in NODE_ATTRIBUTES:
+                if attribute in entry:
+                    setattr(node, attribute, entry[attribute])
+            nodes.append(node)
+    except (KeyError, TypeError, ValueError, AttributeError) as e:  # valid JSON, but not the structure written
+        raise ParseError(f"Analysis bundle {filename} has a corrupt index: {type(e).__name__}: {e}")
+    if not nodes:
+        raise ParseError(f"Analysis bundle {filename} holds no nodes")
+    return nodes[0]
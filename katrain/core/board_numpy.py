@@ -0,0 +1,173 @@
+"""Board position held as NumPy arrays, with chains, liberties, captures and territory found by array operations.
+Used by Game with board_backend="numpy", and directly for bulk work such as checking the legality of every point,
+estimating territory or replaying many games for indexing. Needs numpy, which is not required by the rest of KaTrain.
+"""
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+from katrain.core.game import Game, IllegalMoveException
+from katrain.core.sgf_parser import Move
+
+PLAYER_VALUES = {"B": 1, "W": -1}
+
+
+def neighbour_values(values: np.ndarray, fill) -> List[np.ndarray]:
+    """Returns four arrays holding the value of the left, right, upper and lower neighbour of each point,
+    and fill for neighbours off the board."""
+    padded = np.pad(values, 1, constant_values=fill)
+    return [padded[1:-1, :-2], padded[1:-1, 2:], padded[:-2, 1:-1], padded[2:, 1:-1]]
+
+
+def dilate(mask: np.ndarray) -> np.ndarray:
+    """Returns the points in mask together with their neighbours."""
+    result = mask.copy()
+    for neighbours in neighbour_values(mask, False):
+        result |= neighbours
+    return result
+
+
+class NumpyBoard:
+    """A board position as an array of stone colours, 1 for black, -1 for white and 0 for empty, indexed [y, x]."""
+
+    def __init__(self, board_size: Tuple[int, int]):
+        board_size_x, board_size_y = board_size
+        self.board_size = board_size
+        self.colours = np.zeros((board_size_y, board_size_x), dtype=np.int8)
+        self.moves = np.full((board_size_y, board_size_x), None, dtype=object)  # the Move of each stone
+        self.prisoners = []  # type: List[Move]
+        self.last_capture = []  # type: List[Move]
+        self.stones_hash = 0  # Zobrist hash of the stones, with the keys of Game.zobrist_keys
+
+    @classmethod
+    def replay(cls, board_size: Tuple[int, int], moves: Iterable[Move]) -> "NumpyBoard":
+        """Returns the position after playing moves on an empty board, ignoring ko as for a loaded game."""
+        board = cls(board_size)
+        for move in moves:
+            board.play(move, ignore_ko=True)
+        return board
+
+    def copy(self) -> "NumpyBoard":
+        board = NumpyBoard.__new__(NumpyBoard)
+        board.board_size = self.board_size
+        board.colours = self.colours.copy()
+        board.moves = self.moves.copy()
+        board.prisoners = self.prisoners[:]
+        board.last_capture = self.last_capture[:]
+        board.stones_hash = self.stones_hash
+        return board
+
+    @property
+    def stones(self) -> List[Move]:
+        return list(self.moves[self.colours != 0])
+
+    def chain_mask(self, x: int, y: int) -> np.ndarray:
+        """Returns the points connected to (x, y) with the same colour, or the empty region around it."""
+        same_colour = self.colours == self.colours[y, x]
+        mask = np.zeros_like(same_colour)
+        mask[y, x] = True
+        while True:
+            grown = dilate(mask) & same_colour
+            if np.array_equal(grown, mask):
+                return mask
+            mask = grown
+
+    def liberties(self, mask: np.ndarray) -> np.ndarray:
+        """Returns the empty points next to the points in mask."""
+        return dilate(mask) & (self.colours == 0)
+
+    def label_regions(self) -> np.ndarray:
+        """Returns a label for each point, equal for connected points with the same colour, including empty regions.
+        The label is the smallest flat index in the region."""
+        labels = np.arange(self.colours.size).reshape(self.colours.shape)
+        neighbour_colours = neighbour_values(self.colours, 2)
+        while True:
+            new_labels = labels
+            for neighbours, neighbour_labels in zip(neighbour_colours, neighbour_values(labels, labels.size)):
+                new_labels = np.where(neighbours == self.colours, np.minimum(new_labels, neighbour_labels), new_labels)
+            new_labels = new_labels.ravel()[new_labels]  # follow labels to their own label, merging faster
+            if np.array_equal(new_labels, labels):
+                return labels
+            labels = new_labels
+
+    def liberty_counts(self, labels: np.ndarray) -> np.ndarray:
+        """Returns the number of liberties of the chain at each point, and 0 for empty points."""
+        empty = self.colours == 0
+        chain_liberties = [np.zeros((2, 0), dtype=labels.dtype)]  # pairs of chain label and liberty
+        for neighbours, neighbour_labels in zip(neighbour_values(self.colours, 0), neighbour_values(labels, 0)):
+            liberty_of_stone = empty & (neighbours != 0)
+            chain_liberties.append(np.stack([neighbour_labels[liberty_of_stone], np.flatnonzero(liberty_of_stone)]))
+        chain_liberties = np.unique(np.concatenate(chain_liberties, axis=1), axis=1)  # a liberty counts once
+        counts = np.bincount(chain_liberties[0], minlength=labels.size)
+        return np.where(empty, 0, counts[labels])
+
+    def play(self, move: Move, ignore_ko: bool = False):
+        """Plays a move, capturing stones left without liberties, and raises IllegalMoveException if invalid."""
+        ko_or_snapback = len(self.last_capture) == 1 and self.last_capture[0] == move
+        self.last_capture = []
+
+        if move.is_pass:
+            return
+
+        x, y = move.coords
+        if self.colours[y, x] != 0:
+            raise IllegalMoveException("Space occupied")
+        value = PLAYER_VALUES[move.player]
+        self.colours[y, x] = value
+        self.moves[y, x] = move
+        stone_keys = Game.zobrist_keys(self.board_size)[0]
+        self.stones_hash ^= stone_keys[move.player][y][x]
+
+        board_size_y, board_size_x = self.colours.shape
+        for nx, ny in [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]:
+            if 0 <= nx < board_size_x and 0 <= ny < board_size_y and self.colours[ny, nx] == -value:
+                chain = self.chain_mask(nx, ny)
+                if not self.liberties(chain).any():
+                    self.last_capture += list(self.moves[chain])
+                    for m in self.moves[chain]:
+                        self.stones_hash ^= stone_keys[m.player][m.coords[1]][m.coords[0]]
+                    self.colours[chain] = 0
+                    self.moves[chain] = None
+        if ko_or_snapback and len(self.last_capture) == 1 and not ignore_ko:
+            raise IllegalMoveException("Ko")
+        self.prisoners += self.last_capture
+
+        if not self.liberties(self.chain_mask(x, y)).any():  # TODO: NZ rules?
+            raise IllegalMoveException("Suicide")
+
+    def legal_moves(self, player: str, ignore_ko: bool = False) -> np.ndarray:
+        """Returns whether playing at each point is legal for player, for all points at once."""
+        value = PLAYER_VALUES[player]
+        labels = self.label_regions()
+        liberty_counts = self.liberty_counts(labels)
+        has_liberty = np.zeros(self.colours.shape, dtype=bool)
+        for neighbours, neighbour_liberties in zip(
+            neighbour_values(self.colours, 2), neighbour_values(liberty_counts, 0)
+        ):
+            has_liberty |= neighbours == 0  # an empty point next to it
+            has_liberty |= (neighbours == value) & (neighbour_liberties >= 2)  # connects to a chain with another
+            has_liberty |= (neighbours == -value) & (neighbour_liberties == 1)  # captures
+        legal = (self.colours == 0) & has_liberty
+
+        if not ignore_ko and len(self.last_capture) == 1 and self.last_capture[0].player == player:
+            x, y = self.last_capture[0].coords
+            board = self.copy()
+            try:
+                board.play(self.last_capture[0])
+            except IllegalMoveException:
+                legal[y, x] = False
+        return legal
+
+    def territory(self) -> np.ndarray:
+        """Returns the colour of each stone, and for each empty point the colour of the only player whose stones
+        border its empty region, or 0 if both or neither do. Dead stones are not detected."""
+        labels = self.label_regions()
+        empty = self.colours == 0
+        borders = {}
+        for value in PLAYER_VALUES.values():
+            touches = np.zeros(labels.size, dtype=bool)
+            for neighbours in neighbour_values(self.colours, 0):
+                touches[labels[empty & (neighbours == value)]] = True
+            borders[value] = touches[labels]
+        owner = np.where(borders[1] & ~borders[-1], 1, 0) + np.where(borders[-1] & ~borders[1], -1, 0)
+        return np.where(empty, owner, self.colours).astype(np.int8)
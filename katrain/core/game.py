@@ -1,10 +1,14 @@
 import math
 import os
+import random
 import re
 import threading
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, List, Optional, Union
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple, Union
 
+from katrain.core.analysis_bundle import EXTENSION as ANALYSIS_BUNDLE_EXTENSION, write_analysis_bundle
 from katrain.core.constants import HOMEPAGE, OUTPUT_DEBUG, OUTPUT_INFO
 from katrain.core.engine import KataGoEngine
 from katrain.core.game_node import GameNode
@@ -25,6 +29,10 @@ class Game:
     """Represents a game of go, including an implementation of capture rules."""
 
     DEFAULT_PROPERTIES = {"GM": 1, "FF": 4, "AP": f"KaTrain:{HOMEPAGE}", "CA": "UTF-8"}
+    SNAPSHOT_INTERVAL = 16  # board positions are kept for nodes at multiples of this depth, to replay from
+    MAX_SNAPSHOTS = 256
+    BOARD_BACKENDS = ["python", "numpy"]
+    SUPERKO_RULES = {"chinese": "positional", "aga": "situational"}  # other rules only forbid simple ko
 
     def __init__(
         self,
@@ -33,9 +41,20 @@ class Game:
         move_tree: GameNode = None,
         analyze_fast=False,
         game_properties: Optional[Dict] = None,
+        board_backend: str = "python",
     ):
         self.katrain = katrain
+        if board_backend not in self.BOARD_BACKENDS:
+            raise ValueError(f"Unknown board backend {board_backend}, expected one of {self.BOARD_BACKENDS}")
+        if board_backend == "numpy":
+            from katrain.core.board_numpy import NumpyBoard  # numpy is only needed for this backend
+
+            self._numpy_board_class = NumpyBoard
+        self.board_backend = board_backend
+        self.numpy_board = None
+        self._position_history = None  # superko rule and the position keys in the current branch, built when needed
         self._lock = threading.Lock()
+        self._board_snapshots = OrderedDict()  # type: OrderedDict[GameNode, Tuple]  # least recently used first
         if not isinstance(engine, Dict):
             engine = {"B": engine, "W": engine}
         self.engines = engine
@@ -66,42 +85,165 @@ class Game:
 
         self.set_current_node(self.root)
         threading.Thread(
-            target=lambda: self.analyze_all_nodes(-1_000_000, analyze_fast=analyze_fast), daemon=True
+            target=lambda: self.analyze_all_nodes(-1_000_000, analyze_fast=analyze_fast, even_if_present=False),
+            daemon=True,
         ).start()  # return faster, but bypass Kivy Clock
 
-    def analyze_all_nodes(self, priority=0, analyze_fast=False):
-        for node in self.root.nodes_in_tree:
+    def analyze_all_nodes(self, priority=0, analyze_fast=False, even_if_present=True):
+        for node in self.root.iter_breadth_first():
+            if not even_if_present and node.analysis_ready:
+                continue  # e.g. loaded from an analysis bundle
             node.analyze(self.engines[node.next_player], priority=priority, analyze_fast=analyze_fast)
 
     # -- move tree functions --
     def _calculate_groups(self):
-        board_size_x, board_size_y = self.board_size
         with self._lock:
-            self.board = [
-                [-1 for _x in range(board_size_x)] for _y in range(board_size_y)
-            ]  # type: List[List[int]]  #  board pos -> chain id
-            self.chains = []  # type: List[List[Move]]  #   chain id -> chain
-            self.prisoners = []  # type: List[Move]
-            self.last_capture = []  # type: List[Move]
+            self._position_history = None
+            nodes = self.current_node.nodes_from_root
+            start = 0
+            for depth in range(len(nodes) - 1 - (len(nodes) - 1) % self.SNAPSHOT_INTERVAL, -1, -self.SNAPSHOT_INTERVAL):
+                snapshot = self._board_snapshots.get(nodes[depth])
+                if snapshot:
+                    self._board_snapshots.move_to_end(nodes[depth])
+                    self._restore_board_state(snapshot)
+                    start = depth + 1
+                    break
+            else:
+                self._clear_board()
             try:
-                for node in self.current_node.nodes_from_root:
-                    for m in node.move_with_placements:
+                for depth in range(start, len(nodes)):
+                    for m in nodes[depth].move_with_placements:
                         self._validate_move_and_update_chains(
                             m, True
                         )  # ignore ko since we didn't know if it was forced
+                    self._set_position_hash(nodes[depth])
+                    if depth % self.SNAPSHOT_INTERVAL == 0:
+                        self._board_snapshots[nodes[depth]] = self._board_state()
+                        if len(self._board_snapshots) > self.MAX_SNAPSHOTS:
+                            self._board_snapshots.popitem(last=False)  # least recently used
             except IllegalMoveException as e:
                 raise Exception(f"Unexpected illegal move ({str(e)})")
 
-    def _validate_move_and_update_chains(self, move: Move, ignore_ko: bool):
+    def _clear_board(self):
         board_size_x, board_size_y = self.board_size
+        if self.board_backend == "numpy":
+            self.numpy_board = self._numpy_board_class(self.board_size)
+        self.board = [
+            [-1 for _x in range(board_size_x)] for _y in range(board_size_y)
+        ]  # type: List[List[int]]  #  board pos -> chain id
+        self.chains = []  # type: List[List[Move]]  #   chain id -> chain
+        self.liberties = []  # type: List[Set[Tuple[int, int]]]  #   chain id -> empty points next to it
+        self.prisoners = []  # type: List[Move]
+        self.last_capture = []  # type: List[Move]
+        self.stones_hash = 0  # Zobrist hash of the stones on the board
+
+    def hash_positions(self):
+        """Sets position_hash on every node in the tree, replaying each variation once."""
+        with self._lock:
+            self._clear_board()
+            stack = [(self.root, self._board_state())]
+            try:
+                while stack:
+                    node, state = stack.pop()
+                    self._restore_board_state(state)
+                    while True:
+                        for m in node.move_with_placements:
+                            self._validate_move_and_update_chains(m, True)
+                        self._set_position_hash(node)
+                        if not node.children:
+                            break
+                        stack += [(child, self._board_state()) for child in reversed(node.children[1:])]
+                        node = node.children[0]
+            except IllegalMoveException as e:
+                raise Exception(f"Unexpected illegal move ({str(e)})")
+        self._calculate_groups()
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def zobrist_keys(board_size: Tuple[int, int]) -> Tuple[Dict[str, List[List[int]]], int]:
+        """Returns random 64-bit keys for a stone of each player on each point as keys[player][y][x], and the key
+        for white to move. They are the same in every run, so hashes can be stored and compared between games."""
+        board_size_x, board_size_y = board_size
+        rng = random.Random(f"zobrist {board_size_x}x{board_size_y}")
+        stone_keys = {
+            player: [[rng.getrandbits(64) for _x in range(board_size_x)] for _y in range(board_size_y)]
+            for player in Move.PLAYERS
+        }
+        return stone_keys, rng.getrandbits(64)
+
+    def _set_position_hash(self, node: GameNode):
+        white_to_move_key = self.zobrist_keys(self.board_size)[1]
+        node.position_hash = self.stones_hash ^ (white_to_move_key if node.next_player == "W" else 0)
+
+    def _superko_key(self, stones_hash: int, next_player: str, rule: str) -> int:
+        """Returns the key of a position for the superko rule, which includes the player to move if situational."""
+        return stones_hash ^ (
+            self.zobrist_keys(self.board_size)[1] if rule == "situational" and next_player == "W" else 0
+        )
+
+    def _superko_history(self, rule: str) -> Set[int]:
+        """Returns the keys of all positions in the current branch, collected once and extended as moves are played."""
+        if self._position_history is None or self._position_history[0] != rule:
+            white_to_move_key = self.zobrist_keys(self.board_size)[1]
+            keys = set()
+            for node in self.current_node.nodes_from_root:
+                if node.position_hash is not None:
+                    stones_hash = node.position_hash ^ (white_to_move_key if node.next_player == "W" else 0)
+                    keys.add(self._superko_key(stones_hash, node.next_player, rule))
+            self._position_history = (rule, keys)
+        return self._position_history[1]
+
+    def _board_state(self) -> Tuple:
+        """Returns a copy of the board position, chains and captures, which is not changed by further moves."""
+        if self.board_backend == "numpy":
+            return (self.numpy_board.copy(),)
+        return (
+            [row[:] for row in self.board],
+            [c[:] for c in self.chains],
+            [set(lib) for lib in self.liberties],
+            self.prisoners[:],
+            self.last_capture[:],
+            self.stones_hash,
+        )
 
-        def neighbours(moves):
-            return {
-                self.board[m.coords[1] + dy][m.coords[0] + dx]
-                for m in moves
-                for dy, dx in [(-1, 0), (1, 0), (0, -1), (0, 1)]
-                if 0 <= m.coords[0] + dx < board_size_x and 0 <= m.coords[1] + dy < board_size_y
-            }
+    def _restore_board_state(self, state: Tuple):
+        if self.board_backend == "numpy":
+            self.numpy_board = state[0].copy()
+            self.prisoners, self.last_capture = self.numpy_board.prisoners, self.numpy_board.last_capture
+            self.stones_hash = self.numpy_board.stones_hash
+            return
+        board, chains, liberties, prisoners, last_capture, self.stones_hash = state
+        self.board = [row[:] for row in board]
+        self.chains = [c[:] for c in chains]
+        self.liberties = [set(lib) for lib in liberties]
+        self.prisoners = prisoners[:]
+        self.last_capture = last_capture[:]
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _neighbour_table(board_size: Tuple[int, int]) -> List[List[List[Tuple[int, int]]]]:
+        """Returns the on-board neighbours of each point as table[y][x] -> [(x,y)]"""
+        board_size_x, board_size_y = board_size
+        return [
+            [
+                [
+                    (x + dx, y + dy)
+                    for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]
+                    if 0 <= x + dx < board_size_x and 0 <= y + dy < board_size_y
+                ]
+                for x in range(board_size_x)
+            ]
+            for y in range(board_size_y)
+        ]
+
+    def _validate_move_and_update_chains(self, move: Move, ignore_ko: bool):
+        if self.board_backend == "numpy":
+            try:
+                self.numpy_board.play(move, ignore_ko)
+            finally:
+                self.prisoners, self.last_capture = self.numpy_board.prisoners, self.numpy_board.last_capture
+                self.stones_hash = self.numpy_board.stones_hash
+            return
 
         ko_or_snapback = len(self.last_capture) == 1 and self.last_capture[0] == move
         self.last_capture = []
@@ -109,36 +251,62 @@ class Game:
         if move.is_pass:
             return
 
-        if self.board[move.coords[1]][move.coords[0]] != -1:
+        x, y = move.coords
+        board, chains, liberties = self.board, self.chains, self.liberties
+        if board[y][x] != -1:
             raise IllegalMoveException("Space occupied")
 
-        nb_chains = list({c for c in neighbours([move]) if c >= 0 and self.chains[c][0].player == move.player})
-        if nb_chains:
-            this_chain = nb_chains[0]
-            self.board = [
-                [nb_chains[0] if sq in nb_chains else sq for sq in line] for line in self.board
-            ]  # merge chains connected by this move
-            for oc in nb_chains[1:]:
-                self.chains[nb_chains[0]] += self.chains[oc]
-                self.chains[oc] = []
-            self.chains[nb_chains[0]].append(move)
+        neighbours = self._neighbour_table(self.board_size)
+        stone_keys = self.zobrist_keys(self.board_size)[0]
+        own_chains, opp_chains, move_liberties = set(), set(), set()
+        for nx, ny in neighbours[y][x]:
+            c = board[ny][nx]
+            if c == -1:
+                move_liberties.add((nx, ny))
+            elif chains[c][0].player == move.player:
+                own_chains.add(c)
+            else:
+                opp_chains.add(c)
+
+        if own_chains:  # merge chains connected by this move into the largest, relabelling only the smaller ones
+            this_chain = max(own_chains, key=lambda c: len(chains[c]))
+            for oc in own_chains - {this_chain}:
+                for m in chains[oc]:
+                    board[m.coords[1]][m.coords[0]] = this_chain
+                chains[this_chain] += chains[oc]
+                if len(liberties[oc]) > len(liberties[this_chain]):
+                    liberties[this_chain], liberties[oc] = liberties[oc], liberties[this_chain]
+                liberties[this_chain] |= liberties[oc]
+                chains[oc] = []
+                liberties[oc] = set()
+            chains[this_chain].append(move)
+            liberties[this_chain] |= move_liberties
         else:
-            this_chain = len(self.chains)
-            self.chains.append([move])
-        self.board[move.coords[1]][move.coords[0]] = this_chain
-
-        opp_nb_chains = {c for c in neighbours([move]) if c >= 0 and self.chains[c][0].player != move.player}
-        for c in opp_nb_chains:
-            if -1 not in neighbours(self.chains[c]):
-                self.last_capture += self.chains[c]
-                for om in self.chains[c]:
-                    self.board[om.coords[1]][om.coords[0]] = -1
-                self.chains[c] = []
+            this_chain = len(chains)
+            chains.append([move])
+            liberties.append(move_liberties)
+        board[y][x] = this_chain
+        liberties[this_chain].discard((x, y))
+        self.stones_hash ^= stone_keys[move.player][y][x]
+
+        for c in opp_chains:
+            liberties[c].discard((x, y))
+            if not liberties[c]:
+                self.last_capture += chains[c]
+                for om in chains[c]:
+                    ox, oy = om.coords
+                    board[oy][ox] = -1
+                    self.stones_hash ^= stone_keys[om.player][oy][ox]
+                    for nx, ny in neighbours[oy][ox]:  # captured stones are liberties of the chains around them
+                        if board[ny][nx] >= 0:
+                            liberties[board[ny][nx]].add((ox, oy))
+                chains[c] = []
+                liberties[c] = set()
         if ko_or_snapback and len(self.last_capture) == 1 and not ignore_ko:
             raise IllegalMoveException("Ko")
         self.prisoners += self.last_capture
 
-        if -1 not in neighbours(self.chains[this_chain]):  # TODO: NZ rules?
+        if not liberties[this_chain]:  # TODO: NZ rules?
             raise IllegalMoveException("Suicide")
 
     # Play a Move from the current position, raise IllegalMoveException if invalid.
@@ -146,12 +314,22 @@ class Game:
         board_size_x, board_size_y = self.board_size
         if not move.is_pass and not (0 <= move.coords[0] < board_size_x and 0 <= move.coords[1] < board_size_y):
             raise IllegalMoveException(f"Move {move} outside of board coordinates")
+        superko_rule = self.SUPERKO_RULES.get(KataGoEngine.get_rules(self.root))
         try:
             self._validate_move_and_update_chains(move, ignore_ko)
+            if superko_rule and not ignore_ko and not move.is_pass:  # passing never repeats a position illegally
+                key = self._superko_key(self.stones_hash, move.opponent, superko_rule)
+                if key in self._superko_history(superko_rule):
+                    raise IllegalMoveException("Superko")
         except IllegalMoveException:
             self._calculate_groups()
             raise
         played_node = self.current_node.play(move)
+        self._set_position_hash(played_node)
+        if superko_rule:
+            self._superko_history(superko_rule).add(
+                self._superko_key(self.stones_hash, played_node.next_player, superko_rule)
+            )
         self.current_node = played_node
         if analyze:
             played_node.analyze(self.engines[played_node.next_player])
@@ -170,10 +348,7 @@ class Game:
 
     def redo(self, n_times=1):
         cn = self.current_node  # avoid race conditions
-        for _ in range(n_times):
-            if cn.children:
-                cn = cn.ordered_children[0]
-        self.set_current_node(cn)
+        self.set_current_node(cn.mainline_descendant(n_times))
 
     def cycle_children(self, direction):
         cn = self.current_node  # avoid race conditions
@@ -218,7 +393,9 @@ class Game:
     @property
     def stones(self):
         with self._lock:
-            return sum(self.chains, [])
+            if self.board_backend == "numpy":
+                return self.numpy_board.stones
+            return [m for chain in self.chains for m in chain]
 
     @property
     def ended(self):
@@ -281,13 +458,16 @@ class Game:
         return self.current_node.format_score(score)
 
     def __repr__(self):
+        stones = {m.coords: m.player for m in self.stones}
         return (
-            "\n".join("".join(self.chains[c][0].player if c >= 0 else "-" for c in line) for line in self.board)
+            "\n".join(
+                "".join(stones.get((x, y), "-") for x in range(self.board_size[0])) for y in range(self.board_size[1])
+            )
             + f"\ncaptures: {self.prisoner_count}"
         )
 
     def write_sgf(
-        self, path: str, trainer_config: Optional[Dict] = None,
+        self, path: str, trainer_config: Optional[Dict] = None, save_analysis: bool = True,
     ):
         if trainer_config is None:
             trainer_config = self.katrain.config("trainer")
@@ -310,11 +490,16 @@ class Game:
         show_dots_for = {
             bw: trainer_config.get("eval_show_ai", True) or self.katrain.players_info[bw].human for bw in "BW"
         }
-        sgf = self.root.sgf(
-            save_comments_player=show_dots_for, save_comments_class=save_feedback, eval_thresholds=eval_thresholds
-        )
         with open(file_name, "w", encoding="utf-8") as f:
-            f.write(sgf)
+            self.root.write_sgf(
+                f,
+                save_comments_player=show_dots_for,
+                save_comments_class=save_feedback,
+                eval_thresholds=eval_thresholds,
+            )
+        if save_analysis and any(node.analysis_ready for node in self.root.iter_preorder()):
+            with open(os.path.splitext(file_name)[0] + ANALYSIS_BUNDLE_EXTENSION, "wb") as f:
+                write_analysis_bundle(self.root, f)  # alongside the sgf, to reopen the review without the engine
         return i18n._("sgf written").format(file_name=file_name)
 
     def analyze_extra(self, mode):
@@ -1,5 +1,6 @@
 import copy
 import random
+from types import MappingProxyType
 from typing import Dict, List, Optional, Tuple
 
 from katrain.core.lang import i18n
@@ -11,19 +12,80 @@ from katrain.gui.style import INFO_PV_COLOR
 class GameNode(SGFNode):
     """Represents a single game node, with one or more moves and placements."""
 
+    __slots__ = [
+        "_analysis",
+        "ownership",
+        "policy",
+        "_auto_undo",
+        "_ai_thoughts",
+        "_note",
+        "move_number",
+        "time_used",
+        "analysis_visits_requested",
+        "undo_threshold",
+        "position_hash",
+    ]
+    NO_ANALYSIS = MappingProxyType({"moves": MappingProxyType({}), "root": None})  # read-only, shared by all nodes
+
     def __init__(self, parent=None, properties=None, move=None):
-        super().__init__(parent=parent, properties=properties, move=move)
-        self.analysis = {"moves": {}, "root": None}
+        self.position_hash = None  # Zobrist hash of the stones and player to move, set by Game when it reaches the node
+        super().__init__(parent=parent, properties=properties, move=move)  # after, as setting properties clears it
+        self._analysis = None  # created on receiving the first analysis, as most nodes of a large tree never are
         self.ownership = None
         self.policy = None
-        self.auto_undo = None  # None = not analyzed. False: not undone (good move). True: undone (bad move)
-        self.ai_thoughts = ""
-        self.note = ""
+        self._auto_undo = None  # None = not analyzed. False: not undone (good move). True: undone (bad move)
+        self._ai_thoughts = ""
+        self._note = ""
         self.move_number = 0
         self.time_used = 0
         self.analysis_visits_requested = 0
         self.undo_threshold = random.random()  # for fractional undos
 
+    # attributes which are part of the sgf output reset the serialized node when changed
+    @property
+    def auto_undo(self) -> Optional[bool]:
+        return self._auto_undo
+
+    @auto_undo.setter
+    def auto_undo(self, value: Optional[bool]):
+        self._auto_undo = value
+        self._invalidate_sgf()
+        if self.parent:
+            self.parent._children_changed()  # the order of children depends on it
+
+    @property
+    def ai_thoughts(self) -> str:
+        return self._ai_thoughts
+
+    @ai_thoughts.setter
+    def ai_thoughts(self, value: str):
+        self._ai_thoughts = value
+        self._invalidate_sgf()
+
+    @property
+    def note(self) -> str:
+        return self._note
+
+    @note.setter
+    def note(self, value: str):
+        self._note = value
+        self._invalidate_sgf()
+
+    def _analysis_changed(self):
+        """Comments on a move use the analysis of the node before it, so the children are outdated as well."""
+        self._invalidate_sgf()
+        for child in self._children:  # any deferred variations have not been serialized yet
+            child._invalidate_sgf()
+
+    def _property_changed(self, property):
+        super()._property_changed(property)
+        if property in self.MOVE_PROPERTIES and self.position_hash is not None:
+            for node in self.iter_preorder():  # the positions below depend on this node's moves
+                node.position_hash = None
+
+    def _sgf_cache_key(self, xargs) -> str:
+        return i18n.lang + super()._sgf_cache_key(xargs)
+
     def sgf_properties(self, save_comments_player=None, save_comments_class=None, eval_thresholds=None):
         properties = copy.copy(super().sgf_properties())
         note = self.note.strip()
@@ -67,6 +129,15 @@ class GameNode(SGFNode):
             children, key=lambda c: 0.5 if c.auto_undo is None else int(c.auto_undo)
         )  # analyzed/not undone main, non-teach second, undone last
 
+    @property
+    def analysis(self) -> Dict:
+        return self.NO_ANALYSIS if self._analysis is None else self._analysis
+
+    def _updatable_analysis(self) -> Dict:
+        if self._analysis is None:
+            self._analysis = {"moves": {}, "root": None}
+        return self._analysis
+
     # various analysis functions
     def analyze(self, engine, priority=0, visits=None, time_limit=True, refine_move=None, analyze_fast=False):
         if visits and not refine_move:
@@ -84,13 +155,16 @@ class GameNode(SGFNode):
     def update_move_analysis(self, move_analysis, move_gtp):
         cur = self.analysis["moves"].get(move_gtp)
         if cur is None:
-            self.analysis["moves"][move_gtp] = {
+            self._updatable_analysis()["moves"][move_gtp] = {
                 "move": move_gtp,
                 "order": 999,
                 **move_analysis,
             }  # some default values for keys missing in rootInfo
         elif cur["visits"] < move_analysis["visits"]:
             cur.update(move_analysis)
+        else:
+            return
+        self._analysis_changed()
 
     def set_analysis(self, analysis_json, refine_move):
         if refine_move:
@@ -103,7 +177,8 @@ class GameNode(SGFNode):
                 self.update_move_analysis(move_analysis, move_analysis["move"])
             self.ownership = analysis_json.get("ownership")
             self.policy = analysis_json.get("policy")
-            self.analysis["root"] = analysis_json["rootInfo"]
+            self._updatable_analysis()["root"] = analysis_json["rootInfo"]
+            self._analysis_changed()
             if self.parent and self.move:
                 analysis_json["rootInfo"]["pv"] = [self.move.gtp()] + (
                     analysis_json["moveInfos"][0]["pv"] if analysis_json["moveInfos"] else []
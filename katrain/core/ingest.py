@@ -0,0 +1,84 @@
+"""Summarizes folders of SGF files in parallel, for importing large game collections.
+
+Usage: python -m katrain.core.ingest DIRECTORY [--processes N] [--output FILE]
+"""
+import argparse
+import json
+import os
+import sys
+from multiprocessing import Pool
+from typing import Callable, Dict, Iterator, List, Optional
+
+from katrain.core.sgf_parser import SGF
+
+SGF_EXTENSIONS = (".sgf",)
+
+
+def find_sgf_files(directory: str) -> List[str]:
+    """Returns the paths of all SGF files in a directory and its subdirectories, in a stable order."""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        paths += [os.path.join(dirpath, f) for f in sorted(filenames) if f.lower().endswith(SGF_EXTENSIONS)]
+    return paths
+
+
+def summarize_file(path: str, encoding: Optional[str] = None) -> Dict:
+    """Returns a compact summary of the game in a file: its main properties, the moves of the main line as
+    [player, gtp coordinates] pairs, and the error if it could not be read, is broken or has moves off the board."""
+    try:
+        preview = SGF.parse_preview(path, encoding=encoding, strict=True)
+    except Exception as e:  # one broken file should not stop an import
+        return {"path": path, "properties": {}, "moves": [], "error": f"{type(e).__name__}: {e}"}
+    return {
+        "path": path,
+        "properties": preview["properties"],
+        "moves": [[move.player, move.gtp()] for move in preview["moves"]],
+        "error": None,
+    }
+
+
+def ingest(
+    paths: List[str],
+    processes: Optional[int] = None,
+    progress: Optional[Callable[[int, int, Dict], None]] = None,
+    chunk_size: int = 16,
+) -> Iterator[Dict]:
+    """Summarizes files over a pool of processes, one per core by default, yielding summaries as they complete.
+    progress is called with the number of files done, the total, and the latest summary."""
+    with Pool(processes) as pool:
+        for done, summary in enumerate(pool.imap_unordered(summarize_file, paths, chunksize=chunk_size), 1):
+            if progress:
+                progress(done, len(paths), summary)
+            yield summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", help="folder to search for SGF files")
+    parser.add_argument("--processes", "-j", type=int, default=None, help="worker processes, default one per core")
+    parser.add_argument("--output", "-o", default=None, help="file to write summaries to as JSON lines")
+    args = parser.parse_args()
+
+    paths = find_sgf_files(args.directory)
+    errors = 0
+
+    def report(done, total, summary):
+        nonlocal errors
+        if summary["error"]:
+            errors += 1
+            print(f"{summary['path']}: {summary['error']}", file=sys.stderr)
+        if done % 100 == 0 or done == total:
+            print(f"{done}/{total} files, {errors} errors", file=sys.stderr)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for summary in ingest(paths, processes=args.processes, progress=report):
+            out.write(json.dumps(summary, ensure_ascii=False) + "\n")
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,19 @@
+import codecs
 import copy
+import gzip
+import itertools
+import mmap
+import os
 import re
-from collections import defaultdict
-from typing import Any, Dict, List, Optional, Tuple
+import sys
+import tarfile
+import threading
+import zipfile
+import zlib
+from collections import deque
+from collections.abc import Sequence
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
 
 
 class ParseError(Exception):
@@ -10,35 +22,76 @@ class ParseError(Exception):
     pass
 
 
+def read_contents(filename, mapped=True):
+    """Returns the contents of a file as bytes, memory-mapped if mapped and possible, so that the file is only read
+    as the contents are used."""
+    with open(filename, "rb") as f:
+        if mapped:
+            try:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):  # empty file, or not mappable
+                pass
+        return f.read()
+
+
+@contextmanager
+def open_contents(filename, mapped=True):
+    """Yields the contents of a file as read_contents does, closing the mapping afterwards."""
+    contents = read_contents(filename, mapped)
+    try:
+        yield contents
+    finally:
+        if isinstance(contents, mmap.mmap):
+            contents.close()
+
+
 class Move:
     GTP_COORD = list("ABCDEFGHJKLMNOPQRSTUVWXYZ") + [
         xa + c for xa in "AB" for c in "ABCDEFGHJKLMNOPQRSTUVWXYZ"
     ]  # board size 52+ support
     PLAYERS = "BW"
     SGF_COORD = list("ABCDEFGHIJKLMNOPQRSTUVWXYZ".lower()) + list("ABCDEFGHIJKLMNOPQRSTUVWXYZ")  # sgf goes to 52
+    GTP_COORD_INDEX = {c: i for i, c in enumerate(GTP_COORD)}
+    SGF_COORD_INDEX = {c: i for i, c in enumerate(SGF_COORD)}
+
+    __slots__ = ["player", "coords", "_gtp"]
+    # moves are never modified after creation, so the parsed ones are shared: (class, coords, [board size,] player) -> move
+    _from_gtp_cache: Dict[Tuple, "Move"] = {}
+    _from_sgf_cache: Dict[Tuple, "Move"] = {}
 
     @classmethod
     def from_gtp(cls, gtp_coords, player="B"):
-        """Initialize a move from GTP coordinates and player"""
-        if "pass" in gtp_coords.lower():
-            return cls(coords=None, player=player)
-        match = re.match(r"([A-Z]+)(\d+)", gtp_coords)
-        return cls(coords=(Move.GTP_COORD.index(match[1]), int(match[2]) - 1), player=player)
+        """Initialize a move from GTP coordinates and player, returning a shared instance"""
+        key = (cls, gtp_coords, player)
+        move = Move._from_gtp_cache.get(key)
+        if move is None:
+            if "pass" in gtp_coords.lower():
+                move = cls(coords=None, player=player)
+            else:
+                match = re.match(r"([A-Z]+)(\d+)", gtp_coords)
+                move = cls(coords=(Move.GTP_COORD_INDEX[match[1]], int(match[2]) - 1), player=player)
+            Move._from_gtp_cache[key] = move
+        return move
 
     @classmethod
     def from_sgf(cls, sgf_coords, board_size, player="B"):
-        """Initialize a move from SGF coordinates and player"""
-        if sgf_coords == "" or Move.SGF_COORD.index(sgf_coords[0]) == board_size[0]:  # some servers use [tt] for pass
-            return cls(coords=None, player=player)
-        return cls(
-            coords=(Move.SGF_COORD.index(sgf_coords[0]), board_size[1] - Move.SGF_COORD.index(sgf_coords[1]) - 1),
-            player=player,
-        )
+        """Initialize a move from SGF coordinates and player, returning a shared instance"""
+        key = (cls, sgf_coords, board_size, player)
+        move = Move._from_sgf_cache.get(key)
+        if move is None:
+            index = Move.SGF_COORD_INDEX
+            if sgf_coords == "" or index[sgf_coords[0]] == board_size[0]:  # some servers use [tt] for pass
+                move = cls(coords=None, player=player)
+            else:
+                move = cls(coords=(index[sgf_coords[0]], board_size[1] - index[sgf_coords[1]] - 1), player=player)
+            Move._from_sgf_cache[key] = move
+        return move
 
     def __init__(self, coords: Optional[Tuple[int, int]] = None, player: str = "B"):
         """Initialize a move from zero-based coordinates and player"""
         self.player = player
         self.coords = coords
+        self._gtp = None
 
     def __repr__(self):
         return f"Move({self.player}{self.gtp()})"
@@ -48,9 +101,9 @@ class Move:
 
     def gtp(self):
         """Returns GTP coordinates of the move"""
-        if self.is_pass:
-            return "pass"
-        return Move.GTP_COORD[self.coords[0]] + str(self.coords[1] + 1)
+        if self._gtp is None:
+            self._gtp = "pass" if self.coords is None else Move.GTP_COORD[self.coords[0]] + str(self.coords[1] + 1)
+        return self._gtp
 
     def sgf(self, board_size):
         """Returns SGF coordinates of the move"""
@@ -69,22 +122,137 @@ class Move:
         return "W" if self.player == "B" else "B"
 
 
+class _PathSegment:
+    """A run of nodes each followed by the next, continuing the path from the root of parent at depth offset."""
+
+    __slots__ = ["nodes", "offset", "parent"]
+
+    def __init__(self, node, offset, parent):
+        self.nodes = [node]
+        self.offset = offset
+        self.parent = parent
+
+
+class NodePath(Sequence):
+    """The nodes from the root to a node, as a chain of segments shared with the paths to other nodes.
+    Each segment is extended in place until the tree branches, so a path costs nothing to create or store, and
+    looking up an ancestor only passes the branch points between it and the node."""
+
+    __slots__ = ["_segment", "_length"]
+
+    def __init__(self, segment: _PathSegment, length: int):
+        self._segment = segment
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("NodePath index out of range")
+        segment = self._segment
+        while index < segment.offset:
+            segment = segment.parent
+        return segment.nodes[index - segment.offset]
+
+    def _segments(self) -> List[Tuple[_PathSegment, int]]:
+        """Returns the segments from the root onwards, with the number of nodes of each in this path."""
+        segments, end, segment = [], self._length, self._segment
+        while segment:
+            segments.append((segment, end - segment.offset))
+            end, segment = segment.offset, segment.parent
+        return segments[::-1]
+
+    def __iter__(self):
+        for segment, count in self._segments():
+            yield from segment.nodes[:count]
+
+    def __reversed__(self):
+        for segment, count in reversed(self._segments()):
+            yield from reversed(segment.nodes[:count])
+
+    def __repr__(self):
+        return f"NodePath({list(self)})"
+
+
 class SGFNode:
+    MOVE_PROPERTIES = {"B", "W", "AB", "AW"}
+    GAME_PARAMETER_PROPERTIES = {"SZ", "KM", "RU"}
+    __slots__ = [  # no per-node __dict__, which matters for large trees
+        "_children",
+        "_ordered_children",
+        "_deferred_variations",
+        "_properties",
+        "_encoded_properties",
+        "_moves",
+        "_placements",
+        "_move_with_placements",
+        "_parent",
+        "_root",
+        "_depth",
+        "_sgf_cache",
+        "_game_parameters",
+        "_path_segment",
+        "_mainline",
+    ]
+    _path_lock = threading.Lock()
+    _order_lock = threading.Lock()  # for the ordered children and main line caches, never held while parsing
+
     def __init__(self, parent=None, properties=None, move=None):
-        self.children = []
-        self.properties = defaultdict(list)
+        self._children = ()  # shared empty tuple until the first child is added
+        self._ordered_children = None
+        self._deferred_variations = None  # (parser, offsets) of variations to parse when children are first accessed
+        self._properties = {}
+        self._encoded_properties = None  # property -> (values, encoding) for values decoded only on first access
+        self._moves = None  # decoded moves, placements, and both, cached until their properties change
+        self._placements = None
+        self._move_with_placements = None
+        self._sgf_cache = None  # (cache key, serialized node) of the last export, reset when the output may change
+        self._game_parameters = None  # on the root, property -> parsed board size, komi or ruleset
+        self._path_segment = None  # the part of nodes_from_root that holds this node, set on first use
+        self._mainline = None  # on the root, depth -> node on the main line, see _mainline_index
         if properties:
             for k, v in properties.items():
                 self.set_property(k, v)
         self.parent = parent
         if self.parent:
-            self.parent.children.append(self)
+            self.parent._add_child(self)
         if parent and move:
             self.set_property(move.player, move.sgf(self.board_size))
 
     def sgf_properties(self, **xargs) -> Dict:
         """For hooking into in a subclass and overriding/formatting any additional properties to be output."""
-        return copy.deepcopy(self.properties)
+        return {prop: list(values) for prop, values in self.properties.items()}  # values themselves are immutable
+
+    @property
+    def children(self) -> List["SGFNode"]:
+        """Returns the child nodes, first parsing any deferred variations."""
+        deferred = self._deferred_variations
+        if deferred:
+            deferred[0].parse_deferred_variations(self)
+        return self._children
+
+    def _add_child(self, child):
+        children = self.children  # parses deferred variations first, keeping children in order
+        if children:
+            children.append(child)
+        else:
+            self._children = [child]
+        self._children_changed()
+
+    def _children_changed(self):
+        """Called when a child is added, or the order of the children may have changed."""
+        mainline = (self._root or self.root)._mainline  # called for each node while parsing, so skip the property
+        with SGFNode._order_lock:
+            self._ordered_children = None
+            if mainline:
+                depth = self.depth
+                if depth < len(mainline) and mainline[depth] is self:  # the main line may continue differently
+                    del mainline[depth + 1 :]
 
     @staticmethod
     def order_children(children):
@@ -93,11 +261,19 @@ class SGFNode:
 
     @property
     def ordered_children(self):
-        return self.order_children(self.children)
+        """Returns the children in the order of order_children, cached until children are added or reordered."""
+        ordered_children = self._ordered_children
+        if ordered_children is None:
+            self.children  # parse deferred variations first, which takes the parser lock and then the order lock
+            with SGFNode._order_lock:  # so a concurrent change can not be overwritten by the outdated order
+                ordered_children = self._ordered_children = self.order_children(self._children)
+        return ordered_children
 
     @staticmethod
     def _escape_value(value):
-        return re.sub(r"([\]\\])", r"\\\1", value) if isinstance(value, str) else value  # escape \ and ]
+        if isinstance(value, str) and ("]" in value or "\\" in value):
+            return re.sub(r"([\]\\])", r"\\\1", value)  # escape \ and ]
+        return value
 
     @staticmethod
     def _unescape_value(value):
@@ -105,47 +281,107 @@ class SGFNode:
 
     def sgf(self, **xargs) -> str:
         """Generates an SGF, calling sgf_properties on each node with the given xargs, so it can filter relevant properties if needed."""
+        return "".join(self.sgf_chunks(**xargs))
 
-        def node_sgf_str(node):
-            return ";" + "".join(
-                [
-                    prop + "".join(f"[{self._escape_value(v)}]" for v in values)
-                    for prop, values in node.sgf_properties(**xargs).items()
-                    if values
-                ]
-            )
+    def write_sgf(self, file, chunk_size=1 << 16, **xargs):
+        """Writes the SGF to a file-like object in chunks of about chunk_size characters, without building it first."""
+        buffer, buffer_size = [], 0
+        for chunk in self.sgf_chunks(**xargs):
+            buffer.append(chunk)
+            buffer_size += len(chunk)
+            if buffer_size >= chunk_size:
+                file.write("".join(buffer))
+                buffer, buffer_size = [], 0
+        file.write("".join(buffer))
 
+    def sgf_chunks(self, **xargs) -> Iterator[str]:
+        """Generates the SGF text piece by piece, keeping only a stack of the branches still to be written."""
+        cache_key = self._sgf_cache_key(xargs)
         stack = [")", self, "("]
-        sgf_str = ""
         while stack:
             item = stack.pop()
             if isinstance(item, str):
-                sgf_str += item
+                yield item
             else:
-                sgf_str += node_sgf_str(item)
+                yield item._sgf_node_str(xargs, cache_key)
                 if len(item.children) == 1:
                     stack.append(item.children[0])
                 elif item.children:
-                    stack += sum([[")", c, "("] for c in item.ordered_children[::-1]], [])
-        return sgf_str
+                    for c in item.ordered_children[::-1]:
+                        stack += [")", c, "("]
+
+    def _sgf_cache_key(self, xargs) -> str:
+        """For hooking into in a subclass when the output of sgf_properties depends on more than the xargs."""
+        return repr(sorted(xargs.items()))  # a snapshot, as the xargs may be modified in place between exports
+
+    def _sgf_node_str(self, xargs, cache_key) -> str:
+        cache = self._sgf_cache
+        if cache is not None and cache[0] == cache_key:
+            return cache[1]
+        node_str = ";" + "".join(
+            [
+                prop + "".join(f"[{self._escape_value(v)}]" for v in values)
+                for prop, values in self.sgf_properties(**xargs).items()
+                if values
+            ]
+        )
+        self._sgf_cache = (cache_key, node_str)
+        return node_str
+
+    def _invalidate_sgf(self):
+        """Marks the serialized node as outdated, to be regenerated on the next export."""
+        self._sgf_cache = None
+
+    @property
+    def properties(self) -> Dict[str, List]:
+        """Returns all properties of the node, decoding any values that are still encoded."""
+        if self._encoded_properties:
+            for property in list(self._encoded_properties):
+                self._decode_property(property)
+        return self._properties
+
+    def _decode_property(self, property: str):
+        values, encoding = self._encoded_properties.pop(property)
+        decoded = [self._unescape_value(v.decode(encoding, errors="ignore")) for v in values]
+        self._properties.setdefault(property, []).extend(decoded)
 
     def add_list_property(self, property: str, values: List):
         """Add some values to the property list."""
-        self.properties[property] += values
+        if self._encoded_properties and property in self._encoded_properties:
+            self._decode_property(property)
+        self._properties.setdefault(property, []).extend(values)
+        self._property_changed(property)
+
+    def add_encoded_list_property(self, property: str, values: List[bytes], encoding: str):
+        """Add some escaped values in their original encoding to the property list, to be decoded on first access."""
+        if self._encoded_properties is None:
+            self._encoded_properties = {}
+        if property in self._properties and property not in self._encoded_properties:
+            decoded = [self._unescape_value(v.decode(encoding, errors="ignore")) for v in values]
+            self._properties[property].extend(decoded)
+        else:
+            self._properties.setdefault(property, [])  # keeps property order for output
+            self._encoded_properties.setdefault(property, ([], encoding))[0].extend(values)
+        self._sgf_cache = None
 
     def get_list_property(self, property, default=None) -> Any:
         """Get the list of values for a property."""
-        return self.properties.get(property, default)
+        if self._encoded_properties and property in self._encoded_properties:
+            self._decode_property(property)
+        return self._properties.get(property, default)
 
     def set_property(self, property: str, value: Any):
         """Add some values to the property. If not a list, it will be made into a single-value list."""
         if not isinstance(value, list):
             value = [value]
-        self.properties[property] = value
+        if self._encoded_properties:
+            self._encoded_properties.pop(property, None)
+        self._properties[property] = value
+        self._property_changed(property)
 
     def get_property(self, property, default=None) -> Any:
         """Get the first value of the property, typically when exactly one is expected."""
-        return self.properties.get(property, [default])[0]
+        return self.get_list_property(property, [default])[0]
 
     @property
     def parent(self) -> Optional["SGFNode"]:
@@ -157,28 +393,68 @@ class SGFNode:
         self._parent = parent_node
         self._root = None
         self._depth = None
+        self._path_segment = None
+        if self._children:  # moving a subtree, e.g. deferred variations parsed under a detached node
+            self._game_parameters = self._mainline = None  # only used on a root
+            stack = [self]
+            while stack:  # the nodes below cached the root and depth of the old tree, and moves for its board size
+                node = stack.pop()
+                node._root = node._depth = node._path_segment = None
+                node._moves = node._placements = node._move_with_placements = None
+                stack.extend(node._children)
 
     @property
     def root(self) -> "SGFNode":
         """Returns the root of the tree, cached for speed"""
         if self._root is None:
-            self._root = self.parent.root if self.parent else self
+            uncached, node = [], self
+            while node._root is None and node.parent:  # iterative, so deep trees do not hit the recursion limit
+                uncached.append(node)
+                node = node.parent
+            root = node if node._root is None else node._root
+            for n in uncached + [node]:
+                n._root = root
         return self._root
 
     @property
     def depth(self) -> int:
         """Returns the depth of this node, where root is 0, cached for speed"""
         if self._depth is None:
-            if self.is_root:
-                self._depth = 0
-            else:
-                self._depth = self.parent.depth + 1
+            uncached, node = [], self
+            while node._depth is None and node.parent:
+                uncached.append(node)
+                node = node.parent
+            depth = node._depth = node._depth or 0  # only an uncached root stops with _depth None
+            for n in reversed(uncached):
+                depth += 1
+                n._depth = depth
         return self._depth
 
+    def _game_parameter(self, property):
+        """Returns the parsed value of a game parameter property of the root, cached until it is set again."""
+        root = self.root
+        parameters = root._game_parameters
+        if parameters is None:
+            parameters = root._game_parameters = {}
+        value = parameters.get(property)
+        if value is None:
+            if property == "SZ":
+                value = self._parse_board_size(root.get_property("SZ", "19"))
+            elif property == "KM":
+                value = float(root.get_property("KM", 6.5))
+            else:
+                value = root.get_property("RU", "japanese")
+            parameters[property] = value
+        return value
+
     @property
     def board_size(self) -> Tuple[int, int]:
         """Retrieves the root's SZ property, or 19 if missing. Parses it, and returns board size as a tuple x,y"""
-        size = str(self.root.get_property("SZ", "19"))
+        return self._game_parameter("SZ")
+
+    @staticmethod
+    def _parse_board_size(size) -> Tuple[int, int]:
+        size = str(size)
         if ":" in size:
             x, y = map(int, size.split(":"))
         else:
@@ -189,35 +465,51 @@ class SGFNode:
     @property
     def komi(self) -> float:
         """Retrieves the root's KM property, or 6.5 if missing"""
-        return float(self.root.get_property("KM", 6.5))
+        return self._game_parameter("KM")
 
     @property
     def ruleset(self) -> str:
         """Retrieves the root's RU property, or 'japanese' if missing"""
-        return self.root.get_property("RU", "japanese")
+        return self._game_parameter("RU")
 
     @property
     def moves(self) -> List[Move]:
         """Returns all moves in the node - typically 'move' will be better."""
-        return [
-            Move.from_sgf(move, player=pl, board_size=self.board_size)
-            for pl in Move.PLAYERS
-            for move in self.get_list_property(pl, [])
-        ]
+        if self._moves is None:
+            board_size = self.board_size
+            self._moves = [
+                Move.from_sgf(move, player=pl, board_size=board_size)
+                for pl in Move.PLAYERS
+                for move in self.get_list_property(pl, [])
+            ]
+        return self._moves
 
     @property
     def placements(self) -> List[Move]:
         """Returns all placements (AB/AW) in the node."""
-        return [
-            Move.from_sgf(sgf_coords, player=pl, board_size=self.board_size)
-            for pl in Move.PLAYERS
-            for sgf_coords in self.get_list_property("A" + pl, [])
-        ]
+        if self._placements is None:
+            board_size = self.board_size
+            self._placements = [
+                Move.from_sgf(sgf_coords, player=pl, board_size=board_size)
+                for pl in Move.PLAYERS
+                for sgf_coords in self.get_list_property("A" + pl, [])
+            ]
+        return self._placements
 
     @property
     def move_with_placements(self) -> List[Move]:
         """Returns all moves (B/W) and placements (AB/AW) in the node."""
-        return self.placements + self.moves
+        if self._move_with_placements is None:
+            self._move_with_placements = self.placements + self.moves
+        return self._move_with_placements
+
+    def _property_changed(self, property):
+        """Resets everything cached from the property's values."""
+        if property in self.MOVE_PROPERTIES:
+            self._moves = self._placements = self._move_with_placements = None
+        elif property in self.GAME_PARAMETER_PROPERTIES and self._game_parameters:
+            self._game_parameters.pop(property, None)
+        self._sgf_cache = None
 
     @property
     def move(self) -> Optional[Move]:
@@ -239,28 +531,105 @@ class SGFNode:
     @property
     def empty(self) -> bool:
         """Returns true if node has no children or properties"""
-        return not self.children and not self.properties
+        return not self._children and not self._properties and not self._encoded_properties
 
     @property
     def nodes_in_tree(self) -> List:
-        """Returns all nodes in the tree rooted at this node"""
-        stack = [self]
-        nodes = []
+        """Returns all nodes in the tree rooted at this node, in breadth-first order"""
+        return list(self.iter_breadth_first())
+
+    def iter_breadth_first(self, max_depth=None) -> Iterator["SGFNode"]:
+        """Yields the nodes in the tree rooted at this node level by level, down to max_depth moves below this node"""
+        queue = deque([(self, 0)])
+        while queue:
+            node, depth = queue.popleft()
+            yield node
+            if max_depth is None or depth < max_depth:
+                queue.extend((child, depth + 1) for child in node.children)
+
+    def iter_preorder(self, max_depth=None) -> Iterator["SGFNode"]:
+        """Yields the nodes in the tree rooted at this node depth first, each node before its children, down to
+        max_depth moves below this node. Children are taken in the order they were added, not ordered_children,
+        so for subclasses that reorder branches this is not the order in which sgf() writes them."""
+        stack = [(self, 0)]
         while stack:
-            item = stack.pop(0)
-            nodes.append(item)
-            stack += item.children
-        return nodes
+            node, depth = stack.pop()
+            yield node
+            if max_depth is None or depth < max_depth:
+                stack.extend((child, depth + 1) for child in reversed(node.children))
+
+    def _mainline_index(self, depth) -> List["SGFNode"]:
+        """Returns the main line of the tree from the root, as a list from depth to node, extended up to depth.
+        The list is kept on the root, and cut back when children are added or reordered."""
+        root = self.root
+        while True:
+            with SGFNode._order_lock:
+                mainline = root._mainline
+                if mainline is None:
+                    mainline = root._mainline = [root]
+                if len(mainline) > depth:
+                    return mainline
+                node = mainline[-1]
+            ordered_children = node.ordered_children  # outside the order lock, as it may parse deferred variations
+            if not ordered_children:
+                return mainline
+            with SGFNode._order_lock:
+                if root._mainline is mainline and mainline[-1] is node and node._ordered_children is ordered_children:
+                    mainline.append(ordered_children[0])  # otherwise changed in the meantime, so try again
+
+    def on_mainline(self) -> bool:
+        """Returns True if this node is on the main line of the tree, i.e. reached from the root by redo."""
+        depth = self.depth
+        mainline = self._mainline_index(depth)
+        return depth < len(mainline) and mainline[depth] is self
+
+    def mainline_descendant(self, moves) -> "SGFNode":
+        """Returns the node reached from this one by taking the first of the ordered children the given number of
+        times, or the last node before the branch ends."""
+        if self.on_mainline():
+            mainline = self._mainline_index(self.depth + moves)
+            return mainline[min(self.depth + moves, len(mainline) - 1)]
+        node = self
+        for _ in range(moves):
+            if not node.children:
+                break
+            node = node.ordered_children[0]
+        return node
+
+    def mainline_nodes(self) -> List["SGFNode"]:
+        """Returns this node and all nodes following it, taking the first of the ordered children at each branch."""
+        if self.on_mainline():
+            return self._mainline_index(sys.maxsize)[self.depth :]
+        return list(self.iter_mainline())
+
+    def iter_mainline(self) -> Iterator["SGFNode"]:
+        """Yields this node and the nodes following it, taking the first of the ordered children at each branch"""
+        node = self
+        yield node
+        while node.children:
+            node = node.ordered_children[0]
+            yield node
 
     @property
-    def nodes_from_root(self) -> List:
-        """Returns all nodes from the root up to this node, i.e. the moves played in the current branch of the game"""
-        nodes = [self]
-        n = self
-        while not n.is_root:
-            n = n.parent
-            nodes.append(n)
-        return nodes[::-1]
+    def nodes_from_root(self) -> "NodePath":
+        """Returns all nodes from the root up to this node, i.e. the moves played in the current branch of the game.
+        The sequence shares its storage with the paths to all other nodes, and is created in constant time."""
+        if self._path_segment is None:
+            with SGFNode._path_lock:  # nodes are appended to shared segments, which should happen only once
+                uncached, node = [], self
+                while node._path_segment is None and node.parent:
+                    uncached.append(node)
+                    node = node.parent
+                if node._path_segment is None:  # the root
+                    node._path_segment = _PathSegment(node, 0, None)
+                for n in reversed(uncached):
+                    segment, depth = n.parent._path_segment, n.depth
+                    if segment.offset + len(segment.nodes) == depth:  # the parent ends its segment, so continue it
+                        segment.nodes.append(n)
+                        n._path_segment = segment
+                    else:  # a branch
+                        n._path_segment = _PathSegment(n, depth, segment)
+        return NodePath(self._path_segment, self.depth + 1)
 
     def play(self, move) -> "SGFNode":
         """Either find an existing child or create a new one with the given move."""
@@ -272,7 +641,7 @@ class SGFNode:
     @property
     def next_player(self):
         """Returns player to move"""
-        if "B" in self.properties or "AB" in self.properties:  # root or black moved
+        if "B" in self._properties or "AB" in self._properties:  # root or black moved
             return "W"
         else:
             return "B"
@@ -280,7 +649,7 @@ class SGFNode:
     @property
     def player(self):
         """Returns player that moved last. nb root is considered white played if no handicap stones are placed"""
-        if "B" in self.properties or "AB" in self.properties:
+        if "B" in self._properties or "AB" in self._properties:
             return "B"
         else:
             return "W"
@@ -290,54 +659,408 @@ class SGF:
 
     _NODE_CLASS = SGFNode  # Class used for SGF Nodes, can change this to something that inherits from SGFNode
     # https://xkcd.com/1171/
-    SGFPROP_PAT = re.compile(r"\s*(?:\(|\)|;|(\w+)((\s*\[([^\]\\]|\\.)*\])+))", flags=re.DOTALL)
+    SGFPROP_PAT = re.compile(r"\s*(?:\(|\)|;|(\w+)((?:\s*\[[^\]\\]*(?:\\.[^\]\\]*)*\])+))", flags=re.DOTALL)
+    SGFPROP_BYTES_PAT = re.compile(SGFPROP_PAT.pattern.encode(), flags=re.DOTALL)
+    # text properties, whose values are left encoded until accessed when parsing bytes
+    TEXT_PROPERTIES = set("C GC N AN BR BT CP DT EV GN ON OT PB PC PW RE RO RU SO US WR WT".split())
+    # encodings where no byte of a multi-byte character can be mistaken for SGF syntax such as ']' or '\'
+    BYTE_SAFE_ENCODINGS = {"utf-8", "ascii", "euc_jp", "euc_kr", "gb2312"}
+    ARCHIVE_EXTENSIONS = {"zip": (".zip",), "tar": (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz"), "gz": (".gz",)}
+    # raised for corrupt or truncated archives, gzip raises OSError for a file that is not gzipped
+    ARCHIVE_ERRORS = (zipfile.BadZipFile, tarfile.TarError, zlib.error, EOFError, OSError)
+    PREVIEW_PROPERTIES = {"PB", "PW", "RE", "SZ", "KM", "DT"}
+    ENCODING_DETECTION_SIZE = 1 << 12  # bytes at the start of a collection searched for its CA property
+    # skips to the next '(' or ')' over nodes and properties, checking their syntax, for skipping over variations
+    SKIP_TO_PAREN_PAT = re.compile(r"(?:\s*(?:;|\w+(?:\s*\[[^\]\\]*(?:\\.[^\]\\]*)*\])+))*\s*([()])", flags=re.DOTALL)
+    SKIP_TO_PAREN_BYTES_PAT = re.compile(SKIP_TO_PAREN_PAT.pattern.encode(), flags=re.DOTALL)
+    # finding game boundaries in collections: start of a game, structure within a game, and end of a value
+    SPLIT_PATS = {
+        is_text: [re.compile(pat if is_text else pat.encode()) for pat in [r"\(", r"[()\[]", r"[\\\]]"]]
+        for is_text in [False, True]
+    }
+
+    @classmethod
+    def parse(cls, input_str, lazy_variations=False) -> SGFNode:
+        """Parse a string as SGF.
+        With lazy_variations, only the first variation at each branch is parsed, and others when first accessed."""
+        return cls(input_str, lazy_variations=lazy_variations).root
+
+    @classmethod
+    def parse_file(cls, filename, encoding=None, lazy_variations=False) -> SGFNode:
+        """Parse a file as SGF, encoding will be detected if not given.
+        The file is memory-mapped and parsed as bytes, with text values only decoded when first accessed.
+        Lazy parsing of variations keeps the contents in memory instead, until all variations are parsed.
+        For an archive, the first SGF file in it is parsed."""
+        if cls.archive_type(filename):
+            return cls._parse_bytes(cls.read_archive_member(filename), encoding, lazy_variations=lazy_variations)
+        # lazy parsing needs the contents after the file is closed, so they are read instead of mapped
+        with open_contents(filename, mapped=not lazy_variations) as contents:
+            return cls._parse_bytes(contents, encoding, lazy_variations=lazy_variations)
 
     @classmethod
-    def parse(cls, input_str) -> SGFNode:
-        """Parse a string as SGF."""
-        return cls(input_str).root
+    def _parse_bytes(cls, contents, encoding=None, lazy_variations=False) -> SGFNode:
+        return cls(*cls._parseable_contents(contents, encoding), lazy_variations=lazy_variations).root
 
     @classmethod
-    def parse_file(cls, filename, encoding=None) -> SGFNode:
-        """Parse a file as SGF, encoding will be detected if not given."""
-        with open(filename, "rb") as f:
-            bin_contents = f.read()
-            if not encoding:
-                match = re.search(rb"CA\[(.*?)\]", bin_contents)
-                if match:
-                    encoding = match[1].decode("ascii", errors="ignore")
+    def _parseable_contents(cls, contents, encoding=None) -> Tuple[Any, Optional[str]]:
+        """Returns the contents of a file with their given or detected encoding if that is byte safe, and otherwise
+        the contents decoded to a string with encoding None."""
+        encoding = encoding or cls._detect_encoding(contents)
+        if cls._byte_safe(encoding):
+            return contents, encoding
+        return cls._decode(contents[:], encoding), None
+
+    @classmethod
+    def parse_preview(cls, filename, encoding=None, strict=False) -> Dict:
+        """Quickly reads a file for previewing, returning a dict with the main game properties in "properties",
+        and the moves of the first variation in "moves". Reading stops at the end of the first variation,
+        and no tree is built, so side variations and the values of other properties are never looked at.
+        A truncated or broken game is previewed up to the error, unless strict, which raises ParseError for it
+        as parsing would, checking the syntax of the rest of the game, and also for moves outside the board.
+        For an archive, the first SGF file in it is previewed."""
+        if cls.archive_type(filename):
+            return cls._preview(*cls._parseable_contents(cls.read_archive_member(filename), encoding), strict)
+        with open_contents(filename) as contents:
+            return cls._preview(*cls._parseable_contents(contents, encoding), strict)
+
+    @classmethod
+    def _preview(cls, contents, encoding=None, strict=False) -> Dict:
+        if isinstance(contents, str):
+            pattern, tokens = cls.SGFPROP_PAT, ("(", ")", ";")
+        else:
+            pattern, tokens = cls.SGFPROP_BYTES_PAT, (b"(", b")", b";")
+        ix = contents.find(tokens[0]) + 1
+        if not ix:
+            raise ParseError("Parse error: Expected '('")
+        properties, moves = {}, []
+        in_root, node_empty, depth = True, True, 1
+        while True:
+            match = pattern.match(contents, ix)
+            if not match:
+                if strict:
+                    raise cls._parse_error(contents, ix, encoding)
+                break  # truncated or broken, but still worth previewing
+            ix = match.end()
+            matched_item = match[0].strip()
+            if matched_item == tokens[1]:  # end of the first variation
+                if strict and depth > 1:
+                    cls._skip_to_close(contents, ix, depth - 1, encoding)
+                break
+            if matched_item == tokens[0]:
+                depth += 1
+            elif matched_item == tokens[2]:
+                in_root = in_root and node_empty
+                node_empty = True
+            elif matched_item != tokens[0]:
+                node_empty = False
+                property, value = match[1], match[2].strip()[1:-1]
+                if encoding:
+                    property = property.decode("ascii")
+                    value = value.decode(encoding, errors="ignore")
+                if property in Move.PLAYERS:
+                    moves.append((property, value))
+                elif in_root and property in cls.PREVIEW_PROPERTIES:
+                    properties[property] = SGFNode._unescape_value(re.split(r"\]\s*\[", value)[0])
+        board_size = SGFNode._parse_board_size(properties.get("SZ", "19"))
+        if strict:
+            for player, coords in moves:
+                x, y = [Move.SGF_COORD_INDEX.get(c, -1) for c in coords] if len(coords) == 2 else [-1, -1]
+                is_pass = not coords or x == board_size[0]  # as in Move.from_sgf
+                if not is_pass and not (0 <= x < board_size[0] and 0 <= y < board_size[1]):
+                    raise ParseError(f"Move {player}[{coords}] is outside the {board_size[0]}x{board_size[1]} board")
+        return {
+            "properties": properties,
+            "moves": [Move.from_sgf(coords, player=player, board_size=board_size) for player, coords in moves],
+        }
+
+    @classmethod
+    def archive_type(cls, filename) -> Optional[str]:
+        """Returns "zip", "tar" or "gz" for a file name with a supported archive extension, otherwise None."""
+        filename = os.fspath(filename).lower()
+        for archive_type, extensions in cls.ARCHIVE_EXTENSIONS.items():
+            if filename.endswith(extensions):
+                return archive_type
+
+    @classmethod
+    def _archive_entries(cls, filename) -> Iterator[Tuple[str, BinaryIO]]:
+        """Yields the name and a binary file object for each SGF file in an archive, decompressing on the fly."""
+        archive_type = cls.archive_type(filename)
+        if archive_type == "zip":
+            with zipfile.ZipFile(filename) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and info.filename.lower().endswith(".sgf"):
+                        with archive.open(info) as f:
+                            yield info.filename, f
+        elif archive_type == "tar":
+            with tarfile.open(filename, "r|*") as archive:  # stream mode, reads the archive front to back once
+                for member in archive:
+                    if member.isfile() and member.name.lower().endswith(".sgf"):
+                        yield member.name, archive.extractfile(member)
+        elif archive_type == "gz":
+            with gzip.open(filename, "rb") as f:
+                yield os.path.basename(filename)[: -len(".gz")], f
+        else:
+            raise ValueError(f"Not a supported archive: {filename}")
+
+    @staticmethod
+    @contextmanager
+    def _reading_archive(filename):
+        """Raises the errors of reading a corrupt or truncated archive as ParseError."""
+        try:
+            yield
+        except SGF.ARCHIVE_ERRORS as e:
+            raise ParseError(f"Could not read archive {filename}: {e}") from e
+
+    @classmethod
+    def archive_members(cls, filename, limit: Optional[int] = None) -> List[str]:
+        """Returns the names of the SGF files in an archive, or of the first limit of them, which for archives
+        other than zip saves decompressing the rest."""
+        with cls._reading_archive(filename):
+            if cls.archive_type(filename) == "zip":  # listed in the central directory, nothing is decompressed
+                with zipfile.ZipFile(filename) as archive:
+                    names = [n for n in archive.namelist() if n.lower().endswith(".sgf") and not n.endswith("/")]
+                    return names[:limit]
+            names = []
+            for name, _ in cls._archive_entries(filename):
+                if len(names) == limit:
+                    break
+                names.append(name)
+            return names
+
+    @classmethod
+    def read_archive_member(cls, filename, member=None) -> bytes:
+        """Returns the contents of one SGF file in an archive, by default the first.
+        Zip archives are read directly at the member's position, other archives are decompressed up to it."""
+        with cls._reading_archive(filename):
+            if member is not None and cls.archive_type(filename) == "zip":
+                with zipfile.ZipFile(filename) as archive:
+                    if member in archive.namelist():
+                        return archive.read(member)
+            else:
+                for name, f in cls._archive_entries(filename):
+                    if member is None or name == member:
+                        return f.read()
+        raise ParseError(f"{member or 'No SGF file'} found in {filename}")
+
+    @classmethod
+    def parse_archive_member(cls, filename, member=None, encoding=None, lazy_variations=False) -> SGFNode:
+        """Parse a single SGF file in an archive, by default the first."""
+        return cls._parse_bytes(cls.read_archive_member(filename, member), encoding, lazy_variations=lazy_variations)
+
+    @classmethod
+    def parse_archive(cls, filename, encoding=None) -> Iterator[Tuple[str, SGFNode]]:
+        """Parse all games in all SGF files in an archive, yielding the file name and the root of each game.
+        The archive is streamed, so only the game currently being parsed is kept in memory."""
+        with cls._reading_archive(filename):
+            for name, f in cls._archive_entries(filename):
+                for root in cls.parse_collection(f, encoding):
+                    yield name, root
+
+    @classmethod
+    def parse_collection(cls, file, encoding=None, chunk_size=1 << 16) -> Iterator[SGFNode]:
+        """Parse a file object holding any number of concatenated games, yielding the root of each in turn.
+        The file is read in chunks and only the game currently being parsed is kept in memory.
+        For binary files without an encoding, the CA property near the start is used if the games can not be split
+        as bytes in it, and otherwise the encoding of each game is detected separately."""
+        chunks = cls._read_chunks(file, chunk_size)
+        head, head_size = [], 0
+        for chunk in chunks:
+            head.append(chunk)
+            head_size += len(chunk)
+            if isinstance(chunk, str) or head_size >= cls.ENCODING_DETECTION_SIZE:
+                break
+        chunks = itertools.chain(head, chunks)
+        if head and not isinstance(head[0], str):
+            detected_encoding = encoding or cls._detect_encoding(b"".join(head))
+            if encoding or not cls._byte_safe(detected_encoding):  # split decoded text, safe for any encoding
+                chunks = cls._decode_chunks(chunks, detected_encoding)
+        for game_contents in cls._split_games(chunks):
+            yield cls.parse(game_contents if isinstance(game_contents, str) else cls._decode(game_contents))
+
+    @staticmethod
+    def _read_chunks(file, chunk_size) -> Iterator:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    @staticmethod
+    def _decode_chunks(chunks, encoding) -> Iterator[str]:
+        decoder = codecs.getincrementaldecoder(encoding)(errors="ignore")
+        for chunk in chunks:
+            yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+
+    @classmethod
+    def _decode(cls, bin_contents, encoding=None) -> str:
+        """Decodes SGF contents, using the encoding in its CA property if not given."""
+        return bin_contents.decode(encoding=encoding or cls._detect_encoding(bin_contents), errors="ignore")
+
+    @staticmethod
+    def _detect_encoding(bin_contents) -> str:
+        """Returns the encoding given in the CA property, or the SGF default."""
+        match = re.search(rb"CA\[(.*?)\]", bin_contents)
+        if match:
+            return match[1].decode("ascii", errors="ignore")
+        return "ISO-8859-1"  # default
+
+    @classmethod
+    def _byte_safe(cls, encoding) -> bool:
+        """Returns True if SGF in this encoding can be parsed as bytes."""
+        name = codecs.lookup(encoding).name
+        return name in cls.BYTE_SAFE_ENCODINGS or name.startswith(("iso8859", "cp125"))  # or single byte
+
+    @classmethod
+    def _split_games(cls, chunks: Iterator) -> Iterator:
+        """Yields the contents of each top-level game tree in text or binary chunks, skipping anything between games.
+        The buffer is only compacted when reading more input, keeping this linear in the size of the file."""
+        buffer = next(chunks, "")
+        game_start_pat, tree_pat, value_end_pat = cls.SPLIT_PATS[type(buffer) is str]
+        escape = "\\" if isinstance(buffer, str) else b"\\"
+        pos, depth, in_value, game_start = 0, 0, False, None
+        while True:
+            if in_value:
+                match = value_end_pat.search(buffer, pos)
+            else:
+                match = (tree_pat if depth else game_start_pat).search(buffer, pos)
+            if match is None or (match[0] == escape and match.end() == len(buffer)):  # need more input
+                pos = len(buffer) if match is None else match.start()
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                keep = pos if game_start is None else game_start
+                buffer = buffer[keep:] + chunk
+                pos -= keep
+                if game_start is not None:
+                    game_start = 0
+                continue
+            token, pos = match[0], match.end()
+            if in_value:
+                if token == escape:
+                    pos += 1  # skip escaped character
                 else:
-                    encoding = "ISO-8859-1"  # default
-            decoded = bin_contents.decode(encoding=encoding, errors="ignore")
-            return cls.parse(decoded)
+                    in_value = False
+            elif token in ("[", b"["):
+                in_value = True
+            elif token in ("(", b"("):
+                if not depth:
+                    game_start = match.start()
+                depth += 1
+            else:  # )
+                depth -= 1
+                if not depth:
+                    yield buffer[game_start:pos]
+                    game_start = None
+        if game_start is not None:
+            yield buffer[game_start:]  # unterminated, leave reporting the error to the parser
 
-    def __init__(self, contents):
+    def __init__(self, contents, encoding=None, lazy_variations=False):
+        """Parses contents, either as a string or as bytes in the given encoding."""
         self.contents = contents
-        try:
-            self.ix = self.contents.index("(") + 1
-        except ValueError:
+        self.encoding = encoding
+        self.lazy_variations = lazy_variations
+        self._lock = threading.RLock()  # for parsing deferred variations
+        if isinstance(contents, str):
+            self._pattern, self._tokens = self.SGFPROP_PAT, ("(", ")", ";")
+        else:
+            self._pattern, self._tokens = self.SGFPROP_BYTES_PAT, (b"(", b")", b";")
+        self.ix = self.contents.find(self._tokens[0]) + 1
+        if not self.ix:
             raise ParseError("Parse error: Expected '('")
         self.root = self._NODE_CLASS()
         self._parse_branch(self.root)
 
+    def parse_deferred_variations(self, node: SGFNode):
+        """Parses the variations below node that were skipped by lazy parsing, and adds them to its children."""
+        with self._lock:
+            if not node._deferred_variations:  # parsed by another thread in the meantime
+                return
+            parser = copy.copy(self)  # separate cursor, in case this is triggered during parsing
+            variations = []
+            for ix in node._deferred_variations[1]:
+                parser.ix = ix
+                variations.append(self._NODE_CLASS())
+                parser._parse_branch(variations[-1])
+            for variation in variations:
+                variation.parent = node
+            node._children += variations
+            node._deferred_variations = None
+            node._children_changed()
+
+    def _skip_variation(self):
+        """Moves the cursor past the ')' closing the current variation, checking its syntax without building nodes,
+        so that errors are raised while parsing and not when the variation is first accessed."""
+        self.ix = self._skip_to_close(self.contents, self.ix, encoding=self.encoding)
+
+    @classmethod
+    def _skip_to_close(cls, contents, ix: int, depth: int = 1, encoding=None) -> int:
+        """Returns the position after the ')' closing depth open variations, checking the syntax up to there."""
+        if isinstance(contents, str):
+            pattern, skip_pattern, open_token = cls.SGFPROP_PAT, cls.SKIP_TO_PAREN_PAT, "("
+        else:
+            pattern, skip_pattern, open_token = cls.SGFPROP_BYTES_PAT, cls.SKIP_TO_PAREN_BYTES_PAT, b"("
+        while depth:
+            match = skip_pattern.match(contents, ix)
+            if not match:
+                token = pattern.match(contents, ix)
+                while token:  # find where the error is to report it
+                    ix = token.end()
+                    token = pattern.match(contents, ix)
+                raise cls._parse_error(contents, ix, encoding)
+            ix = match.end()
+            depth += 1 if match[1] == open_token else -1
+        return ix
+
     def _parse_branch(self, current_move: SGFNode):
+        """Parses the branch below current_move, keeping an explicit stack of open variations instead of recursing."""
+        open_branches = []  # nodes to continue from when the current variation is closed
+        open_token, close_token, node_token = self._tokens
         while self.ix < len(self.contents):
-            match = re.match(self.SGFPROP_PAT, self.contents[self.ix :])
+            match = self._pattern.match(self.contents, self.ix)  # match at cursor, never slice the remaining input
             if not match:
                 break
-            self.ix += len(match[0])
+            self.ix = match.end()
             matched_item = match[0].strip()
-            if matched_item == ")":
-                return
-            if matched_item == "(":
-                self._parse_branch(self._NODE_CLASS(parent=current_move))
-            elif matched_item == ";":
+            if matched_item == close_token:
+                if not open_branches:
+                    return
+                current_move = open_branches.pop()
+            elif matched_item == open_token:
+                if self.lazy_variations and current_move._children:  # not the first variation, parse later
+                    if current_move._deferred_variations is None:
+                        current_move._deferred_variations = (self, [])
+                    current_move._deferred_variations[1].append(self.ix)
+                    self._skip_variation()
+                    continue
+                open_branches.append(current_move)
+                current_move = self._NODE_CLASS(parent=current_move)
+            elif matched_item == node_token:
                 if not current_move.empty:  # ignore ; that generate empty nodes
                     current_move = self._NODE_CLASS(parent=current_move)
             else:
-                property, value = match[1], match[2].strip()[1:-1]
-                values = re.split(r"\]\s*\[", value)
-                current_move.add_list_property(property, [SGFNode._unescape_value(v) for v in values])
-        if self.ix < len(self.contents):
-            raise ParseError(f"Parse Error: unexpected character at {self.contents[self.ix:self.ix+25]}")
-        raise ParseError("Parse Error: expected ')' at end of input.")
+                if self.encoding is None:
+                    property, value = match[1], match[2].strip()[1:-1]
+                    values = [SGFNode._unescape_value(v) for v in re.split(r"\]\s*\[", value)]
+                else:
+                    property, value = match[1].decode("ascii"), match[2].strip()[1:-1]
+                    values = re.split(rb"\]\s*\[", value)
+                    if property in self.TEXT_PROPERTIES:
+                        current_move.add_encoded_list_property(property, values, self.encoding)
+                        continue
+                    values = [SGFNode._unescape_value(v.decode(self.encoding, errors="ignore")) for v in values]
+                if property not in self.TEXT_PROPERTIES:
+                    values = [sys.intern(v) for v in values]  # share coordinates and such between nodes
+                current_move.add_list_property(property, values)
+        raise self._parse_error(self.contents, self.ix, self.encoding)
+
+    @staticmethod
+    def _parse_error(contents, ix: int, encoding=None) -> ParseError:
+        """Returns the error for parsing stopping at ix before the end of the game, in contents of the given encoding
+        if they are bytes."""
+        if ix < len(contents):
+            snippet = contents[ix : ix + 25]
+            if not isinstance(snippet, str):
+                snippet = snippet.decode(encoding or "ascii", errors="replace")
+            return ParseError(f"Parse Error: unexpected character at {snippet}")
+        return ParseError("Parse Error: expected ')' at end of input.")
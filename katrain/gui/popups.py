@@ -14,6 +14,7 @@ from kivymd.uix.boxlayout import MDBoxLayout
 from kivymd.uix.selectioncontrol import MDCheckbox
 from kivymd.uix.textfield import MDTextField
 
+from katrain.core.analysis_bundle import EXTENSION as ANALYSIS_BUNDLE_EXTENSION
 from katrain.core.constants import (
     AI_CONFIG_DEFAULT,
     AI_DEFAULT,
@@ -24,6 +25,7 @@ from katrain.core.constants import (
 )
 from katrain.core.engine import KataGoEngine
 from katrain.core.lang import i18n
+from katrain.core.sgf_parser import SGF, ParseError
 from katrain.core.utils import find_package_resource
 from katrain.gui.kivyutils import BackgroundMixin, I18NSpinner
 from katrain.gui.style import DEFAULT_FONT, EVAL_COLORS
@@ -376,3 +378,25 @@ class LoadSGFPopup(BoxLayout):
         ]
         self.filesel.path = os.path.abspath(os.path.expanduser(app.gui.config("general/sgf_load")))
         self.filesel.select_string = i18n._("Load File")
+        self.filesel.bind(selection=self.update_preview)
+
+    def update_preview(self, _instance, selection):
+        self.preview.text = ""
+        if not selection or not os.path.isfile(selection[0]):
+            return
+        if selection[0].lower().endswith(ANALYSIS_BUNDLE_EXTENSION):  # not an sgf, and loading it reads all analysis
+            return
+        try:
+            preview = SGF.parse_preview(selection[0])
+            several_games = SGF.archive_type(selection[0]) and len(SGF.archive_members(selection[0], limit=2)) > 1
+        except (ParseError, OSError, LookupError, ValueError):  # ValueError for invalid property values such as SZ
+            return
+        props = preview["properties"]
+        parts = [
+            f"{props.get('PB', '?')} - {props.get('PW', '?')}",
+            props.get("RE"),
+            props.get("DT"),
+            i18n._("move").format(number=len(preview["moves"])),
+            i18n._("archive first game") if several_games else None,
+        ]
+        self.preview.text = "    ".join(part for part in parts if part)
@@ -59,11 +59,7 @@ class ScoreGraph(BackgroundMixin):
         self.navigate_move = [None, 0, 0, 0]
 
     def initialize_from_game(self, root):
-        self.nodes = [root]
-        node = root
-        while node.children:
-            node = node.ordered_children[0]
-            self.nodes.append(node)
+        self.nodes = root.mainline_nodes()
         self.highlighted_index = 0
 
     def show_graphs(self, keys):
@@ -139,9 +135,7 @@ class ScoreGraph(BackgroundMixin):
             if index + 1 < len(self.nodes) and (node is None or self.nodes[index + 1] not in node.children):
                 self.nodes = self.nodes[: index + 1]  # on branch switching, don't show history from other branch
             if index == len(self.nodes) - 1:  # possibly just switched branch
-                while node.children:  # add children back
-                    node = node.ordered_children[0]
-                    self.nodes.append(node)
+                self.nodes += node.mainline_nodes()[1:]  # add children back
             Clock.schedule_once(self.update_graph, 0)
 
 
@@ -50,6 +50,7 @@ setup(
         "kivymd>=0.104.1",
         "screeninfo;platform_system!='Darwin'",  # for screen resolution, has problems on macos
     ],
+    extras_require={"numpy": ["numpy"]},  # for the numpy board backend
     python_requires=">=3.6, <4",
     entry_points={"console_scripts": ["katrain=katrain.__main__:run_app"]},
     classifiers=[
@@ -0,0 +1,81 @@
+import pytest
+
+from katrain.core.analysis_bundle import HEADER, MAGIC, VERSION, read_analysis_bundle, write_analysis_bundle
+from katrain.core.game import KaTrainSGF
+from katrain.core.sgf_parser import ParseError
+
+
+def analysis(score, best_move):
+    return {
+        "moveInfos": [{"move": best_move, "visits": 10, "scoreLead": score, "winrate": 0.5, "order": 0, "pv": []}],
+        "rootInfo": {"scoreLead": score, "winrate": 0.5, "visits": 10},
+        "ownership": [i / 100 for i in range(81)],
+        "policy": [0.25] * 82,
+    }
+
+
+def test_analysis_bundle(tmp_path):
+    root = KaTrainSGF.parse("(;GM[1]FF[4]SZ[9]PB[Black]C[a comment];B[ee](;W[cc];B[gg])(;W[gc]))")
+    nodes = list(root.iter_preorder())
+    for i, node in enumerate(nodes[:-1]):
+        node.set_analysis(analysis(float(i), "C7"), None)
+    nodes[2].note = "note"
+    nodes[2].auto_undo = True
+    nodes[4].auto_undo = False  # ordered first, so the main line changes if it is not kept
+    path = tmp_path / "game.ktab"
+    with open(path, "wb") as f:
+        write_analysis_bundle(root, f)
+
+    loaded = read_analysis_bundle(str(path), node_class=KaTrainSGF._NODE_CLASS)
+    with open(path, "wb") as f:  # overwriting the file it was read from
+        write_analysis_bundle(loaded, f)
+    loaded = read_analysis_bundle(str(path), node_class=KaTrainSGF._NODE_CLASS)
+    loaded_nodes = list(loaded.iter_preorder())
+    assert loaded.sgf() == root.sgf()
+    assert [node.move.gtp() for node in loaded.mainline_nodes()[1:]] == ["E5", "G7"]
+    for node, loaded_node in zip(nodes, loaded_nodes):
+        assert loaded_node.properties == node.properties
+        assert loaded_node.analysis == node.analysis
+        assert loaded_node.note == node.note and loaded_node.auto_undo == node.auto_undo
+        for attribute in ["ownership", "policy"]:
+            if getattr(node, attribute) is None:
+                assert getattr(loaded_node, attribute) is None
+            else:
+                assert getattr(loaded_node, attribute).tolist() == pytest.approx(getattr(node, attribute))
+    assert loaded_nodes[1].policy_ranking[0][0] == 0.25
+    assert loaded_nodes[1].points_lost == nodes[1].points_lost == -1.0
+
+    (tmp_path / "game.sgf").write_text(root.sgf())
+    with pytest.raises(ParseError):
+        read_analysis_bundle(str(tmp_path / "game.sgf"))
+
+
+def test_corrupt_analysis_bundle(tmp_path):
+    root = KaTrainSGF.parse("(;GM[1]FF[4]SZ[9];B[ee];W[cc])")
+    for node in root.iter_preorder():
+        node.set_analysis(analysis(0.0, "C7"), None)
+    path = tmp_path / "game.ktab"
+    with open(path, "wb") as f:
+        write_analysis_bundle(root, f)
+    contents = path.read_bytes()
+    index_end = HEADER.size + HEADER.unpack_from(contents)[2]
+    index = contents[HEADER.size : index_end]
+
+    def corrupt(bundle_index, values=contents[index_end:]):
+        bundle_index += b" " * (-len(bundle_index) % 4)
+        return HEADER.pack(MAGIC, VERSION, len(bundle_index)) + bundle_index + values
+
+    for corrupted in [
+        contents[:6],  # truncated header
+        contents[: len(contents) - 2],  # values not a whole number of floats
+        contents[: index_end - 40],  # index cut off
+        corrupt(index[:-10]),  # invalid JSON
+        corrupt(b'{"nodes": [{"parent": -1}]}'),  # missing properties
+        corrupt(b'{"nodes": [{"parent": -1, "properties": {}}, {"parent": 5, "properties": {}}]}'),
+        corrupt(b'{"nodes": [{"parent": -1, "properties": {}, "policy": [0, 1000]}]}'),
+        corrupt(b'{"nodes": 3}'),
+        corrupt(b"\xff\xfe"),  # not UTF-8
+    ]:
+        path.write_bytes(corrupted)
+        with pytest.raises(ParseError):
+            read_analysis_bundle(str(path), node_class=KaTrainSGF._NODE_CLASS)
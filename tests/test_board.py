@@ -1,4 +1,5 @@
 import pytest
+import random
 
 from katrain.core.game import Game, IllegalMoveException, Move
 from katrain.core.base_katrain import KaTrainBase, OUTPUT_INFO
@@ -103,3 +104,104 @@ class TestBoard:
         b.play(Move(coords=None, player="B"))
         b.play(Move.from_gtp("A1", player="W"))
         assert 3 == len(b.prisoners)
+
+    def test_snapshots(self):
+        b = Game(MockKaTrain(), MockEngine())
+        rng = random.Random(1)
+        for start_depth in [0, 100, 40]:  # a main line and two branches
+            b.set_current_node(b.current_node.nodes_from_root[start_depth])
+            while b.current_node.depth < start_depth + 200:
+                try:
+                    b.play(Move((rng.randrange(9), rng.randrange(9)), player=b.current_node.next_player))
+                except IllegalMoveException:
+                    b.play(Move(None, player=b.current_node.next_player))
+        assert b.prisoners  # captures are replayed from snapshots too
+        nodes = b.root.nodes_in_tree
+        rng.shuffle(nodes)
+        for node in nodes:
+            b.set_current_node(node)
+            state = b._board_state()
+            b._board_snapshots.clear()
+            b._calculate_groups()
+            assert b._board_state() == state
+        assert 0 < len(b._board_snapshots) <= Game.MAX_SNAPSHOTS
+
+    def test_liberties(self):
+        b = Game(MockKaTrain(), MockEngine())
+        rng = random.Random(2)
+        while b.current_node.depth < 300:
+            try:
+                b.play(Move((rng.randrange(9), rng.randrange(9)), player=b.current_node.next_player))
+            except IllegalMoveException:
+                b.play(Move(None, player=b.current_node.next_player))
+            for c, chain in enumerate(b.chains):
+                expected = {
+                    (x, y)
+                    for m in chain
+                    for x, y in b._neighbour_table(b.board_size)[m.coords[1]][m.coords[0]]
+                    if b.board[y][x] == -1
+                }
+                assert all(b.board[m.coords[1]][m.coords[0]] == c for m in chain)
+                assert b.liberties[c] == expected
+
+    def test_position_hash(self):
+        b = Game(MockKaTrain(), MockEngine())
+        empty_hash = b.root.position_hash
+        for gtp in ["D4", "Q16", "Q4", "D16"]:
+            b.play(Move.from_gtp(gtp, player=b.current_node.next_player))
+        transposed = b.current_node.position_hash
+        b.set_current_node(b.root)
+        for gtp in ["Q4", "D16", "D4", "Q16"]:  # the same stones in a different order
+            b.play(Move.from_gtp(gtp, player=b.current_node.next_player))
+        assert b.current_node.position_hash == transposed
+        b.play(Move(None, player="B"))
+        assert b.current_node.position_hash != transposed  # same stones, other player to move
+
+        b.set_current_node(b.root)
+        b.play(Move.from_gtp("A2", player="B"))
+        b.play(Move.from_gtp("A1", player="W"))
+        captured = b.play(Move.from_gtp("B1", player="B"))  # captures A1
+        b.undo(3)
+        b.play(Move.from_gtp("B1", player="B"))
+        b.play(Move(None, player="W"))
+        b.play(Move.from_gtp("A2", player="B"))
+        assert b.current_node.position_hash != empty_hash
+        assert b.current_node.position_hash == captured.position_hash
+
+        hashes = {node: node.position_hash for node in b.root.nodes_in_tree}
+        for node in b.root.nodes_in_tree:
+            node.position_hash = None
+        b.hash_positions()
+        assert {node: node.position_hash for node in b.root.nodes_in_tree} == hashes
+        b.root.children[0].set_property("B", "ab")
+        assert b.root.position_hash is not None
+        assert all(node.position_hash is None for node in b.root.children[0].nodes_in_tree)
+
+    def test_superko(self):
+        for rules in ["japanese", "chinese", "aga"]:
+            b = Game(MockKaTrain(), MockEngine(), game_properties={"RU": rules})
+            for move in ["A2", "B1"]:
+                b.play(Move.from_gtp(move, player="B"))
+            for move in ["B2", "C1"]:
+                b.play(Move.from_gtp(move, player="W"))
+            b.play(Move.from_gtp("A1", player="W"))
+            b.play(Move(None, player="B"))
+            b.play(Move(None, player="W"))
+            retake = Move.from_gtp("B1", player="B")  # not a simple ko after the passes, but repeats the stones
+            if rules == "chinese":
+                with pytest.raises(IllegalMoveException, match="Superko"):
+                    b.play(retake)
+                assert 1 == len(b.prisoners)
+                b.play(retake, ignore_ko=True)
+            else:  # aga is situational, and the position had the other player to move
+                b.play(retake)
+            assert 2 == len(b.prisoners)
+
+            b.play(Move(None, player="W"))
+            b.play(Move(None, player="B"))
+            retake = Move.from_gtp("A1", player="W")  # repeats the stones and the player to move
+            if rules == "japanese":
+                b.play(retake)
+            else:
+                with pytest.raises(IllegalMoveException, match="Superko"):
+                    b.play(retake)
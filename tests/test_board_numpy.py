@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from katrain.core.board_numpy import NumpyBoard  # noqa: E402
+from katrain.core.game import Game, IllegalMoveException, Move  # noqa: E402
+from tests.test_board import MockEngine, MockKaTrain  # noqa: E402
+
+
+def random_games(n_moves, seed):
+    """Plays the same random moves with both board backends, passing on illegal moves."""
+    games = [Game(MockKaTrain(), MockEngine(), board_backend=backend) for backend in Game.BOARD_BACKENDS]
+    rng = random.Random(seed)
+    for _ in range(n_moves):
+        move = Move((rng.randrange(9), rng.randrange(9)), player=games[0].current_node.next_player)
+        try:
+            games[0].play(move)
+        except IllegalMoveException:
+            move = Move(None, player=move.player)
+            games[0].play(move)
+        for game in games[1:]:
+            game.play(move)
+    return games
+
+
+class TestNumpyBoard:
+    def test_same_as_python_backend(self):
+        python_game, numpy_game = random_games(300, seed=3)
+        assert python_game.prisoners
+        for node in python_game.root.nodes_in_tree[::7]:
+            python_game.set_current_node(node)
+            numpy_game.set_current_node(node)
+            assert {m.coords: m.player for m in python_game.stones} == {m.coords: m.player for m in numpy_game.stones}
+            assert python_game.prisoner_count == numpy_game.prisoner_count
+            assert str(python_game) == str(numpy_game)
+            assert python_game.stones_hash == numpy_game.stones_hash
+
+    def test_legal_moves(self):
+        python_game, numpy_game = random_games(150, seed=4)
+        board = numpy_game.numpy_board
+        for player in Move.PLAYERS:
+            legal = board.legal_moves(player)
+            for x in range(19):
+                for y in range(19):
+                    try:
+                        board.copy().play(Move((x, y), player=player))
+                        assert legal[y, x]
+                    except IllegalMoveException:
+                        assert not legal[y, x]
+
+    def test_ko(self):
+        board = NumpyBoard.replay(
+            (19, 19), [Move.from_gtp(gtp, player=p) for gtp, p in [("A2", "B"), ("B1", "B"), ("B2", "W"), ("C1", "W")]]
+        )
+        board.play(Move.from_gtp("A1", player="W"))
+        assert not board.legal_moves("B")[0, 1]
+        with pytest.raises(IllegalMoveException, match="Ko"):
+            board.copy().play(Move.from_gtp("B1", player="B"))
+        assert board.legal_moves("B", ignore_ko=True)[0, 1]
+
+    def test_territory(self):
+        board = NumpyBoard.replay((5, 5), [Move((2, y), player="B") for y in range(5)] + [Move((3, 2), player="W")])
+        territory = board.territory()
+        assert (territory[:, :2] == 1).all()
+        assert (territory[:, 2] == 1).all()
+        assert territory[2, 3] == -1
+        assert territory[0, 4] == 0  # next to both the black wall and the white stone
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            Game(MockKaTrain(), MockEngine(), board_backend="bitboard")
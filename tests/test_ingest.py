@@ -0,0 +1,44 @@
+import os
+
+from katrain.core.ingest import find_sgf_files, ingest, summarize_file
+
+
+def test_ingest(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "a.sgf").write_text("(;GM[1]FF[4]SZ[19]PB[Black]PW[White];B[pd];W[dp])")
+    (tmp_path / "sub" / "b.SGF").write_text("(;GM[1]SZ[9];B[ee](;W[cc])(;W[gg]))")
+    (tmp_path / "broken.sgf").write_text("no game here")
+    (tmp_path / "notes.txt").write_text("(;B[aa])")
+    paths = find_sgf_files(str(tmp_path))
+    assert [os.path.relpath(p, tmp_path) for p in paths] == ["a.sgf", "broken.sgf", os.path.join("sub", "b.SGF")]
+
+    progress = []
+    summaries = {
+        os.path.basename(s["path"]): s
+        for s in ingest(paths, processes=2, progress=lambda done, total, _: progress.append((done, total)))
+    }
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+    assert summaries["a.sgf"] == summarize_file(paths[0])
+    assert summaries["a.sgf"]["properties"] == {"SZ": "19", "PB": "Black", "PW": "White"}
+    assert summaries["a.sgf"]["moves"] == [["B", "Q16"], ["W", "D4"]]
+    assert summaries["b.SGF"]["moves"] == [["B", "E5"], ["W", "C7"]]
+    assert summaries["broken.sgf"]["error"].startswith("ParseError")
+    assert summaries["a.sgf"]["error"] is None
+
+
+def test_summarize_errors(tmp_path):
+    games = {
+        "truncated": "(;GM[1]SZ[19];B[pd];W[dp",
+        "unclosed": "(;GM[1]SZ[19];B[pd](;W[dp])(;W[dd]",
+        "bad_variation": "(;GM[1]SZ[19];B[pd](;W[dp])(;W[dd]!!))",
+        "off_board": "(;GM[1]SZ[19];B[pd];W[zz])",
+        "off_small_board": "(;GM[1]SZ[9];B[ee];W[ek])",
+        "passes": "(;GM[1]SZ[19];B[];W[tt];B[pd](;W[dp])(;W[dd]))",
+    }
+    for name, game in games.items():
+        (tmp_path / f"{name}.sgf").write_text(game)
+    summaries = {name: summarize_file(str(tmp_path / f"{name}.sgf")) for name in games}
+    for name in ["truncated", "unclosed", "bad_variation", "off_board", "off_small_board"]:
+        assert summaries[name]["error"].startswith("ParseError"), name
+    assert summaries["passes"]["error"] is None
+    assert summaries["passes"]["moves"] == [["B", "pass"], ["W", "pass"], ["B", "Q16"], ["W", "D4"]]
@@ -1,6 +1,11 @@
+import io
 import os
+import sys
+import threading
 
-from katrain.core.sgf_parser import SGF, SGFNode
+import pytest
+
+from katrain.core.sgf_parser import SGF, Move, ParseError, SGFNode
 
 
 def test_simple():
@@ -94,3 +99,358 @@ def test_pandanet():
 def test_ogs():
     file = os.path.join(os.path.dirname(__file__), "data/ogs.sgf")
     tree = SGF.parse_file(file)
+
+
+def test_deeply_nested_variations():
+    n = 100_000
+    input_sgf = "(;FF[4]" + "(;B[aa]" * n + ")" * (n + 1)
+    root = SGF.parse(input_sgf)
+    node = root
+    while node.children:
+        assert 1 == len(node.children)
+        node = node.children[0]
+    assert n == node.depth
+    assert root is node.root
+    assert "(;FF[4]" + ";B[aa]" * n + ")" == root.sgf()
+
+
+def test_wide_variations():
+    n = 100_000
+    input_sgf = "(;FF[4]" + "(;B[aa])" * n + ")"
+    root = SGF.parse(input_sgf)
+    assert n == len(root.children)
+    assert all(c.depth == 1 and c.get_property("B") == "aa" for c in root.children)
+    assert input_sgf == root.sgf()
+
+
+def test_collection():
+    games = [
+        "(;GM[1]FF[4]CA[UTF-8]PB[表]C[a comment with ) and ( and \\] in it];B[dp](;W[pp])(;W[dd]))",
+        "(;GM[1]FF[4]SZ[9]PW[b\\\\];B[ee])",
+        "(;GM[1]FF[4]CA[UTF-8]GN[三];B[aa];W[bb])",
+    ]
+    contents = "junk before games ) [\n".join(games) + "\ntrailing junk"
+    for chunk_size in [1, 7, 1 << 16]:
+        for file in [io.BytesIO(contents.encode("utf-8")), io.StringIO(contents)]:
+            roots = list(SGF.parse_collection(file, chunk_size=chunk_size))
+            assert [SGF.parse(g).sgf() for g in games] == [r.sgf() for r in roots]
+    roots = list(SGF.parse_collection(io.BytesIO(contents.encode("shift_jis")), encoding="shift_jis", chunk_size=5))
+    assert ["表", "b\\", "三"] == [r.get_property(p) for r, p in zip(roots, ["PB", "PW", "GN"])]
+    game = "(;GM[1]FF[4]CA[Shift_JIS]C[表])"  # the second byte of 表 is a backslash
+    for chunk_size in [1, 7, 1 << 16]:  # the encoding is taken from the start, as the games can not split as bytes
+        roots = list(SGF.parse_collection(io.BytesIO((game * 3).encode("shift_jis")), chunk_size=chunk_size))
+        assert ["表"] * 3 == [r.get_property("C") for r in roots]
+    with pytest.raises(ParseError):
+        list(SGF.parse_collection(io.BytesIO(b"(;B[aa])(;W[bb]")))
+
+
+def test_deferred_decoding(tmp_path):
+    input_sgf = "(;GM[1]FF[4]CA[UTF-8]PB[Kō \\] 表]C[first]SZ[9];B[ee]C[(;comment\\\\)])"
+    file = tmp_path / "game.sgf"
+    file.write_bytes(input_sgf.encode("utf-8"))
+    root = SGF.parse_file(str(file))
+    assert {"PB", "C"} == set(root._encoded_properties)
+    assert "9" == root.get_property("SZ")
+    assert "Kō ] 表" == root.get_property("PB")
+    assert {"C"} == set(root._encoded_properties)
+    assert "ee" == root.children[0].get_property("B")
+    assert input_sgf == root.sgf()
+    assert not root._encoded_properties and not root.children[0]._encoded_properties
+
+    input_sgf = "(;GM[1]FF[4]CA[Shift_JIS]PB[表];B[ee]C[表])"  # 表 ends in the byte for \
+    file.write_bytes(input_sgf.encode("shift_jis"))
+    root = SGF.parse_file(str(file))
+    assert "表" == root.get_property("PB")
+    assert input_sgf == root.sgf()
+
+
+def test_lazy_variations():
+    input_sgf = "(;GM[1]FF[4]SZ[19](;B[dp];W[pp](;B[pj]C[(])(;PL[B]AW[jp](;B[aa])(;B[bb])))(;B[pd](;W[ee])(;W[ff])))"
+    root = SGF.parse(input_sgf, lazy_variations=True)
+    assert 1 == len(root._children) and root._deferred_variations
+    mainline = root
+    while mainline._children:
+        mainline = mainline._children[0]
+    assert "pj" == mainline.get_property("B") and 3 == mainline.depth
+    assert 10 == len(root.nodes_in_tree)
+    assert SGF.parse(input_sgf).sgf() == root.sgf()
+    assert not any(node._deferred_variations for node in root.nodes_in_tree)
+
+    input_sgf = "(;FF[4](;B[aa])(;B[bb]);B[cc])"  # variations followed by a node should keep their order
+    assert SGF.parse(input_sgf).sgf() == SGF.parse(input_sgf, lazy_variations=True).sgf()
+    with pytest.raises(ParseError):
+        SGF.parse("(;FF[4](;B[aa])(;B[bb]C[)]", lazy_variations=True)
+    for input_sgf in ["(;FF[4](;B[aa])(;B[bb]!!))", "(;FF[4](;B[aa])(;B[bb];C))", "(;FF[4](;B[aa])(;B[bb](;W[cc]x)))"]:
+        with pytest.raises(ParseError) as full_error:
+            SGF.parse(input_sgf)
+        with pytest.raises(ParseError) as lazy_error:  # while loading, not when the variation is accessed
+            SGF.parse(input_sgf, lazy_variations=True)
+        assert str(full_error.value) == str(lazy_error.value)
+
+    input_sgf = "(;SZ[9]KM[0.5]RU[chinese](;B[aa];W[bb])(;B[gc];W[cg];B[ii]))"  # not the default board size or komi
+    root = SGF.parse(input_sgf, lazy_variations=True)
+    node = root.children[1].children[0].children[0]
+    assert node.root is root and 3 == node.depth
+    assert (9, 9) == node.board_size and 0.5 == node.komi and "chinese" == node.ruleset
+    assert "J1" == node.move.gtp()
+    assert [root, root.children[1], root.children[1].children[0], node] == list(node.nodes_from_root)
+
+
+def test_lazy_variations_threads():
+    def branch(depth):
+        return ";W[bb](" + branch(depth - 1) + ")(" + branch(depth - 1) + ")" if depth else ";B[aa]"
+
+    input_sgf = "(;GM[1](" + branch(8) + ")(" + branch(8) + "))"
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads often, to run into lock order problems
+    try:
+        for _ in range(10):  # deferred variations parsed by one thread while another follows the main line
+            root = SGF.parse(input_sgf, lazy_variations=True)
+            threads = [
+                threading.Thread(target=lambda: list(root.iter_breadth_first()), daemon=True),
+                threading.Thread(target=root.mainline_nodes, daemon=True),
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=10)
+                assert not thread.is_alive()
+            assert root.mainline_nodes() == list(root.iter_mainline())
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+
+def test_lazy_variations_file(tmp_path):
+    input_sgf = "(;GM[1]FF[4]CA[UTF-8]C[表](;B[dp]C[x];W[pp](;B[pj])(;B[ee]C[\\]]))(;B[pd];W[dd]))"
+    file = tmp_path / "game.sgf"
+    file.write_bytes(input_sgf.encode("utf-8"))
+    root = SGF.parse_file(str(file), lazy_variations=True)
+    assert root._deferred_variations
+    assert input_sgf == root.sgf()
+
+
+def test_parse_error_message(tmp_path):
+    file = tmp_path / "game.sgf"
+    file.write_bytes("(;GM[1]CA[UTF-8](;B[aa]C[表])(;B[bb]表x))".encode("utf-8"))
+    for parse, options in [
+        (SGF.parse_file, {}),
+        (SGF.parse_file, {"lazy_variations": True}),
+        (SGF.parse_preview, {"strict": True}),
+    ]:
+        with pytest.raises(ParseError, match=r"^Parse Error: unexpected character at 表x\)\)$"):  # not as bytes
+            parse(str(file), **options)
+
+
+def test_preview(tmp_path):
+    input_sgf = "(;GM[1]FF[4]CA[UTF-8]SZ[13]PB[表]PW[W \\] x]RE[B+R]C[(;B[aa\\])];B[dd]C[)];W[]PB[no](;B[ee])(;B[ff]))"
+    file = tmp_path / "game.sgf"
+    file.write_bytes(input_sgf.encode("utf-8"))
+    preview = SGF.parse_preview(str(file))
+    assert {"SZ": "13", "PB": "表", "PW": "W ] x", "RE": "B+R"} == preview["properties"]
+    assert ["B D10", "W pass", "B E9"] == [f"{m.player} {m.gtp()}" for m in preview["moves"]]
+
+    file = os.path.join(os.path.dirname(__file__), "data/panda1.sgf")
+    root = SGF.parse_file(file)
+    preview = SGF.parse_preview(file)
+    assert {p: root.get_property(p) for p in preview["properties"]} == preview["properties"]
+    assert [m for node in root.nodes_in_tree for m in node.moves] == preview["moves"]
+
+
+def test_cached_moves():
+    root = SGF.parse("(;GM[1]FF[4]SZ[9]AB[aa];B[bb])")
+    node = root.children[0]
+    assert node.moves is node.moves and node.move_with_placements is node.move_with_placements
+    assert [Move((1, 7), "B")] == node.moves
+    node.add_list_property("W", ["cc"])
+    assert node.move is None and 2 == len(node.move_with_placements)
+    root.set_property("AB", ["ab", "ba"])
+    root.set_property("C", "placements unchanged")
+    assert [Move((0, 7), "B"), Move((1, 8), "B")] == root.placements == root.move_with_placements
+
+
+def test_write_sgf():
+    input_sgf = "(;GM[1]FF[4]SZ[19]C[a \\\\ b \\] c](;B[dp];W[pp](;B[pj])(;PL[B]AW[jp]))(;B[pd]))"
+    root = SGF.parse(input_sgf)
+    for chunk_size in [1, 10, 1 << 16]:
+        out = io.StringIO()
+        root.write_sgf(out, chunk_size=chunk_size)
+        assert input_sgf == out.getvalue() == root.sgf()
+
+
+def test_sgf_cache():
+    root = SGF.parse("(;GM[1]FF[4]SZ[19];B[dp];W[pp](;B[pj])(;B[pd]))")
+    first = root.sgf()
+    assert root.sgf() == first
+    node = root.children[0].children[0]
+    node.set_property("C", "comment")
+    node.children[1].add_list_property("LB", ["aa:x"])
+    SGFNode(parent=node.children[0], move=Move.from_gtp("D16", player="W"))
+    assert root.sgf() == "(;GM[1]FF[4]SZ[19];B[dp];W[pp]C[comment](;B[pj];W[dd])(;B[pd]LB[aa:x]))"
+
+
+def test_shared_moves():
+    move = Move.from_gtp("Q16", player="W")
+    assert move is Move.from_gtp("Q16", player="W")
+    assert move == Move((15, 15), player="W") and move.gtp() == "Q16" and move.sgf((19, 19)) == "pd"
+    assert move is not Move.from_gtp("Q16", player="B")
+    assert Move.from_sgf("pd", (19, 19), player="W") == move
+    assert Move.from_sgf("pd", (19, 19), player="W") is Move.from_sgf("pd", (19, 19), player="W")
+    assert Move.from_sgf("pd", (13, 13), player="W").coords == (15, 9)
+    assert Move.from_sgf("tt", (19, 19)).is_pass and Move.from_gtp("pass").is_pass
+    assert Move.from_gtp("AB52").coords == (26, 51)
+
+
+def test_traversal():
+    root = SGF.parse("(;GM[1]FF[4]SZ[19];B[aa](;W[ba];B[ca])(;W[bb](;B[cb])(;B[cc])))")
+    gtp = lambda nodes: [node.move.gtp() if node.move else "root" for node in nodes]
+    assert gtp(root.iter_preorder()) == ["root", "A19", "B19", "C19", "B18", "C18", "C17"]
+    assert gtp(root.iter_breadth_first()) == ["root", "A19", "B19", "B18", "C19", "C18", "C17"]
+    assert gtp(root.nodes_in_tree) == gtp(root.iter_breadth_first())
+    assert gtp(root.iter_mainline()) == ["root", "A19", "B19", "C19"]
+    assert gtp(root.iter_preorder(max_depth=2)) == ["root", "A19", "B19", "B18"]
+    assert gtp(root.children[0].iter_breadth_first(max_depth=1)) == ["A19", "B19", "B18"]
+    chain = SGF.parse("(;GM[1]" + ";B[aa];W[bb]" * 50_000 + ")")
+    assert 100_001 == len(chain.nodes_in_tree) == sum(1 for _ in chain.iter_preorder())
+
+
+def test_cached_game_parameters():
+    root = SGF.parse("(;GM[1]FF[4]SZ[9:13]KM[0.5];B[aa];W[bb])")
+    node = root.children[0].children[0]
+    assert (9, 13) == node.board_size and 0.5 == node.komi and "japanese" == node.ruleset
+    root.set_property("SZ", "19")
+    root.set_property("KM", 7.5)
+    root.add_list_property("RU", ["aga"])
+    assert (19, 19) == node.board_size and 7.5 == node.komi and "aga" == node.ruleset
+    node.set_property("SZ", "13")  # not the root
+    assert (19, 19) == node.board_size
+
+
+def test_archives(tmp_path):
+    import gzip
+    import tarfile
+    import zipfile
+
+    games = {
+        "a.sgf": "(;GM[1]FF[4]SZ[19]PB[Black];B[pd];W[dp])",
+        "dir/b.sgf": "(;GM[1]SZ[9];B[ee])(;GM[1]SZ[13];B[gg])",
+    }
+    with zipfile.ZipFile(tmp_path / "games.zip", "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("readme.txt", "not a game")
+        for name, contents in games.items():
+            archive.writestr(name, contents)
+    with tarfile.open(tmp_path / "games.tar.gz", "w:gz") as archive:
+        archive.add(tmp_path / "games.zip", arcname="skipped.zip")
+        for name in games:
+            path = tmp_path / name.replace("/", "_")
+            path.write_text(games[name])
+            archive.add(path, arcname=name)
+    with gzip.open(tmp_path / "c.sgf.gz", "wt") as f:
+        f.write(games["a.sgf"])
+    with zipfile.ZipFile(tmp_path / "shift_jis.zip", "w") as archive:
+        archive.writestr("games.sgf", ("(;GM[1]CA[Shift_JIS]C[表])" * 2).encode("shift_jis"))
+    assert ["表"] * 2 == [root.get_property("C") for _, root in SGF.parse_archive(tmp_path / "shift_jis.zip")]
+
+    for archive in ["games.zip", "games.tar.gz"]:
+        path = str(tmp_path / archive)
+        assert SGF.archive_members(path) == list(games)
+        assert [(name, root.board_size) for name, root in SGF.parse_archive(path)] == [
+            ("a.sgf", (19, 19)),
+            ("dir/b.sgf", (9, 9)),
+            ("dir/b.sgf", (13, 13)),
+        ]
+        assert SGF.parse_file(path).sgf() == games["a.sgf"]
+        assert SGF.parse_archive_member(path, "dir/b.sgf").board_size == (9, 9)
+        assert SGF.parse_preview(path)["properties"]["PB"] == "Black"
+        assert SGF.archive_members(path, limit=1) == ["a.sgf"]
+        with pytest.raises(ParseError):
+            SGF.read_archive_member(path, "missing.sgf")
+        assert SGF.parse_file(tmp_path / archive).sgf() == games["a.sgf"]  # also for a path object
+    assert SGF.parse_file(str(tmp_path / "c.sgf.gz")).sgf() == games["a.sgf"]
+    assert SGF.archive_members(str(tmp_path / "c.sgf.gz")) == ["c.sgf"]
+
+    with zipfile.ZipFile(tmp_path / "empty.zip", "w") as archive:
+        archive.writestr("readme.txt", "not a game")
+    contents = (tmp_path / "games.tar.gz").read_bytes()
+    (tmp_path / "truncated.tar.gz").write_bytes(contents[: len(contents) // 2])
+    (tmp_path / "corrupt.zip").write_bytes(b"PK not a zip file")
+    (tmp_path / "corrupt.sgf.gz").write_bytes(b"not gzipped")
+    with pytest.raises(ParseError):
+        SGF.parse_file(tmp_path / "empty.zip")
+    assert [] == list(SGF.parse_archive(tmp_path / "empty.zip"))
+    for archive in ["truncated.tar.gz", "corrupt.zip", "corrupt.sgf.gz"]:
+        with pytest.raises(ParseError):
+            SGF.parse_file(tmp_path / archive)
+        with pytest.raises(ParseError):
+            list(SGF.parse_archive(tmp_path / archive))
+
+
+def test_nodes_from_root():
+    root = SGF.parse("(;GM[1]FF[4]SZ[19];B[aa](;W[ba];B[ca])(;W[bb](;B[cb])(;B[cc])))")
+    for node in root.nodes_in_tree:
+        expected = [node]
+        while expected[0].parent:
+            expected.insert(0, expected[0].parent)
+        path = node.nodes_from_root
+        assert list(path) == expected and len(path) == node.depth + 1
+        assert [path[i] for i in range(len(path))] == expected and path[-1] is node and path[0] is root
+        assert path[::-1] == list(reversed(path)) == expected[::-1] and path[1:3] == expected[1:3]
+        assert node in path and path.index(node) == node.depth
+    with pytest.raises(IndexError):
+        root.nodes_from_root[1]
+
+    chain = SGF.parse("(;GM[1]" + ";B[aa];W[bb]" * 50_000 + ")")
+    *_, last = chain.iter_mainline()
+    path = last.nodes_from_root
+    assert len(path) == 100_001 and path[50_000].depth == 50_000 and path[0] is chain
+    SGFNode(parent=path[10], move=Move((1, 1), player="B"))  # a branch leaves the existing paths intact
+    assert list(last.nodes_from_root) == list(path) and path[11].parent is path[10]
+    assert path[10].children[1].nodes_from_root[:11] == path[:11]
+
+
+def test_mainline_index():
+    root = SGF.parse("(;GM[1]FF[4]SZ[19];B[aa](;W[ba];B[ca])(;W[bb](;B[cb])(;B[cc])))")
+    b, w1, w2 = root.children[0], root.children[0].children[0], root.children[0].children[1]
+    assert root.mainline_nodes() == list(root.iter_mainline()) == [root, b, w1, w1.children[0]]
+    assert root.mainline_descendant(2) is w1 and root.mainline_descendant(999) is w1.children[0]
+    assert w1.on_mainline() and not w2.on_mainline()
+    assert w2.mainline_descendant(5) is w2.children[0] and w2.mainline_nodes() == [w2, w2.children[0]]
+    extra = SGFNode(parent=w1.children[0], move=Move((5, 5), player="W"))  # continues the main line
+    assert root.mainline_descendant(999) is extra and b.mainline_nodes()[-1] is extra
+
+    class ReversedNode(SGFNode):
+        __slots__ = []
+
+        @staticmethod
+        def order_children(children):
+            return children[::-1]
+
+    class ReversedSGF(SGF):
+        _NODE_CLASS = ReversedNode
+
+    root = ReversedSGF.parse("(;GM[1];B[aa](;W[ba])(;W[bb]))")
+    assert root.mainline_descendant(2).move.gtp() == "B18"
+    SGFNode(parent=root.children[0], move=Move((5, 5), player="W"))  # now first in order
+    assert root.mainline_descendant(2).move.gtp() == "F6" and root.mainline_nodes()[-1].move.gtp() == "F6"
+
+
+def test_cached_ordered_children():
+    class CountingNode(SGFNode):
+        __slots__ = []
+        sorts = 0
+
+        @staticmethod
+        def order_children(children):
+            CountingNode.sorts += 1
+            return sorted(children, key=lambda c: c.get_property("PRIO", "5"))
+
+    class CountingSGF(SGF):
+        _NODE_CLASS = CountingNode
+
+    root = CountingSGF.parse("(;GM[1];B[aa](;W[ba]PRIO[3])(;W[bb]PRIO[1]))")
+    node = root.children[0]
+    assert [c.move.gtp() for c in node.ordered_children] == ["B18", "B19"]
+    node.ordered_children
+    root.mainline_descendant(2)
+    assert CountingNode.sorts == 2  # once for each node with children
+    CountingNode(parent=node, properties={"W": "cc", "PRIO": "0"})
+    assert [c.move.gtp() for c in node.ordered_children] == ["C17", "B18", "B19"] and CountingNode.sorts == 3